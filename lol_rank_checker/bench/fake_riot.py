@@ -0,0 +1,164 @@
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from aiohttp import web
+
+# ==========================================
+# ローカルの Riot API 代替サーバー (ベンチマーク用)
+# ==========================================
+# account / summoner / matchlist / match のフィクスチャを返す。
+# 遅延・429 (レート制限ヘッダー付き)・5xx・Cloudflare の HTML エラーページを任意の割合で混ぜられる。
+CLOUDFLARE_PAGE = ("<html><head><title>520: Web server is returning an unknown error</title></head>"
+                   "<body><h1>Web server is returning an unknown error</h1><p>Cloudflare Ray ID: bench</p></body></html>")
+
+
+# ---------- フィクスチャ ----------
+def generate_fixtures(n_players, matches_per_player=20, pool_ratio=0.6, seed=1):
+    # 同じ試合を複数人が共有するよう、試合プールから各プレイヤーの履歴を選ぶ
+    rnd = random.Random(seed)
+    players = [{"puuid": f"bench-puuid-{i:05d}", "gameName": f"Player{i}", "tagLine": "JP1"} for i in range(n_players)]
+    pool_size = max(int(n_players * matches_per_player * pool_ratio / 10), matches_per_player)
+    match_players = {f"JP1_{9000000000 + m}": [] for m in range(pool_size)}
+    match_ids = list(match_players)
+
+    matchlists = {}
+    for p in players:
+        ids = rnd.sample(match_ids, matches_per_player)
+        matchlists[p["puuid"]] = ids
+        for mid in ids: match_players[mid].append(p["puuid"])
+
+    matches = {}
+    base_time = 1700000000000
+    for m, mid in enumerate(match_ids):
+        puuids = match_players[mid][:10]
+        puuids += [f"bench-filler-{mid}-{k}" for k in range(10 - len(puuids))]
+        duration = rnd.randint(240, 2400)
+        participants = []
+        for k, puuid in enumerate(puuids):
+            participants.append({
+                "puuid": puuid, "teamId": 100 if k < 5 else 200, "win": (k < 5) == (m % 2 == 0),
+                "kills": rnd.randint(0, 15), "deaths": rnd.randint(0, 14), "assists": rnd.randint(0, 20),
+                "totalMinionsKilled": rnd.randint(0, 280), "neutralMinionsKilled": rnd.randint(0, 40),
+                "goldEarned": rnd.randint(4000, 18000), "totalDamageDealtToChampions": rnd.randint(0, 40000),
+                **{f"item{i}": rnd.choice([0, 1001, 3006, 3031, 6672]) for i in range(7)},
+            })
+        matches[mid] = {"metadata": {"matchId": mid, "participants": puuids},
+                        "info": {"gameCreation": base_time + m * 60000, "gameDuration": duration,
+                                 "participants": participants}}
+
+    # 新しい試合ほど前に来るよう並べ替える
+    for puuid, ids in matchlists.items():
+        ids.sort(key=lambda i: matches[i]["info"]["gameCreation"], reverse=True)
+
+    return {
+        "accounts": {f"{p['gameName']}#{p['tagLine']}".lower(): p for p in players},
+        "summoners": {p["puuid"]: {"puuid": p["puuid"], "summonerLevel": rnd.randint(30, 200)} for p in players},
+        "matchlists": matchlists,
+        "matches": matches,
+    }
+
+
+def load_fixtures(path):
+    # 実際の API から記録したデータも同じ形式 (accounts / summoners / matchlists / matches) で読める
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_fixtures(fixtures, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixtures, f, ensure_ascii=False)
+
+
+# ---------- サーバー本体 ----------
+class FakeRiotServer:
+    def __init__(self, fixtures, latency_ms=30, jitter_ms=20, app_limits="500:10,30000:600",
+                 rate_429=0.0, rate_5xx=0.0, rate_cloudflare=0.0, seed=1):
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.app_limits = [tuple(int(x) for x in part.split(":")) for part in app_limits.split(",")]
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rate_cloudflare = rate_cloudflare
+        self.rnd = random.Random(seed)
+        self.requests = Counter()
+        self.statuses = Counter()
+        # (リージョン, window) -> [ウィンドウ開始時刻, 回数]
+        self.windows = {}
+        self._runner = None
+        self.port = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/{{region}}"
+
+    def _rate_headers(self, region):
+        now = time.monotonic()
+        counts = []
+        over = None
+        for limit, window in self.app_limits:
+            w = self.windows.setdefault((region, window), [now, 0])
+            if now >= w[0] + window: w[0], w[1] = now, 0
+            w[1] += 1
+            counts.append(f"{w[1]}:{window}")
+            if w[1] > limit: over = max(over or 0, w[0] + window - now)
+        headers = {"X-App-Rate-Limit": ",".join(f"{l}:{w}" for l, w in self.app_limits),
+                   "X-App-Rate-Limit-Count": ",".join(counts)}
+        return headers, over
+
+    async def _respond(self, request, endpoint, payload):
+        region = request.match_info["region"]
+        self.requests[endpoint] += 1
+        await asyncio.sleep(max(self.latency_ms + self.rnd.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000)
+
+        headers, over = self._rate_headers(region)
+        roll = self.rnd.random()
+        if over is not None or roll < self.rate_429:
+            headers.update({"Retry-After": str(max(int(over or 1), 1)), "X-Rate-Limit-Type": "application"})
+            status, body, ctype = 429, json.dumps({"status": {"status_code": 429}}), "application/json"
+        elif roll < self.rate_429 + self.rate_5xx:
+            status, body, ctype = 503, json.dumps({"status": {"status_code": 503}}), "application/json"
+        elif roll < self.rate_429 + self.rate_5xx + self.rate_cloudflare:
+            status, body, ctype = 520, CLOUDFLARE_PAGE, "text/html"
+        elif payload is None:
+            status, body, ctype = 404, json.dumps({"status": {"status_code": 404}}), "application/json"
+        else:
+            status, body, ctype = 200, json.dumps(payload), "application/json"
+        self.statuses[status] += 1
+        return web.Response(status=status, text=body, content_type=ctype, headers=headers)
+
+    async def account(self, request):
+        key = f"{request.match_info['name']}#{request.match_info['tag']}".lower()
+        return await self._respond(request, "account", self.fixtures["accounts"].get(key))
+
+    async def summoner(self, request):
+        return await self._respond(request, "summoner", self.fixtures["summoners"].get(request.match_info["puuid"]))
+
+    async def matchlist(self, request):
+        ids = self.fixtures["matchlists"].get(request.match_info["puuid"], [])
+        start_time = int(request.query.get("startTime", 0)) * 1000
+        if start_time:
+            ids = [i for i in ids if self.fixtures["matches"][i]["info"]["gameCreation"] >= start_time]
+        count = int(request.query.get("count", 20))
+        return await self._respond(request, "matchlist", ids[:count])
+
+    async def match(self, request):
+        return await self._respond(request, "match", self.fixtures["matches"].get(request.match_info["match_id"]))
+
+    async def start(self, port=0):
+        app = web.Application()
+        app.router.add_get("/{region}/riot/account/v1/accounts/by-riot-id/{name}/{tag}", self.account)
+        app.router.add_get("/{region}/lol/summoner/v4/summoners/by-puuid/{puuid}", self.summoner)
+        app.router.add_get("/{region}/lol/match/v5/matches/by-puuid/{puuid}/ids", self.matchlist)
+        app.router.add_get("/{region}/lol/match/v5/matches/{match_id}", self.match)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner: await self._runner.cleanup()
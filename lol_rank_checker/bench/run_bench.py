@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+# lol_rank_checker/ のモジュール (bot.py など) を import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_riot import FakeRiotServer, generate_fixtures, load_fixtures
+
+# ==========================================
+# オフラインベンチマーク
+# ==========================================
+# 使い方 (lol_rank_checker/ で実行):
+#   python bench/run_bench.py --users 1000 --link-samples 50
+#   python bench/run_bench.py --users 10000 --mongo mongodb://localhost:27017 --rate-5xx 0.02
+# 本物の Riot キーは不要。--mongo を指定した時だけ /audit も計測する (使い捨ての DB を使う)。
+BENCH_DB_NAME = "lol_bot_bench"
+
+
+def percentile(values, p):
+    if not values: return 0.0
+    values = sorted(values)
+    k = min(int(round((len(values) - 1) * p / 100)), len(values) - 1)
+    return values[k]
+
+
+class FakeMessage:
+    async def edit(self, **kwargs):
+        pass
+
+
+class FakeGuild:
+    id = 0
+    name = "bench"
+    roles = []
+    members = []
+
+    def get_member(self, user_id):
+        return None
+
+
+class FakeChannel:
+    # run_audit_logic には TextChannel 相当 (id / guild / send) を渡せばよい
+    id = 0
+    guild = FakeGuild()
+
+    async def send(self, *args, **kwargs):
+        return FakeMessage()
+
+
+async def bench_link(bot, fixtures, samples, concurrency):
+    accounts = list(fixtures["accounts"].values())[:samples]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = {}
+
+    async def one(acct):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await bot.analyze_player_stats(acct["gameName"], acct["tagLine"])
+            latencies.append(time.perf_counter() - start)
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(a) for a in accounts))
+    return {"wall": time.perf_counter() - start, "latencies": latencies, "statuses": statuses}
+
+
+async def bench_audit(bot, fixtures, mongo_url, users):
+    from pymongo import MongoClient
+    client = MongoClient(mongo_url)
+    client.drop_database(BENCH_DB_NAME)
+    db = client[BENCH_DB_NAME]
+    docs = [{"guild_id": FakeGuild.id, "discord_id": 10 ** 17 + i, "riot_name": a["gameName"], "riot_tag": a["tagLine"], "puuid": a["puuid"],
+             "level": 1} for i, a in enumerate(list(fixtures["accounts"].values())[:users])]
+    db.users.insert_many(docs)
+
+    bot.users_col = db.users
+    bot.users_repo.collection = db.users
+    bot.audit_col = db.audit_state
+
+    start = time.perf_counter()
+    await bot.run_audit_logic(FakeChannel())
+    wall = time.perf_counter() - start
+    client.drop_database(BENCH_DB_NAME)
+    return {"wall": wall, "users": len(docs)}
+
+
+async def main(args):
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else generate_fixtures(args.users, seed=args.seed)
+    server = await FakeRiotServer(fixtures, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                  app_limits=args.app_limits, rate_429=args.rate_429, rate_5xx=args.rate_5xx,
+                                  rate_cloudflare=args.rate_cloudflare, seed=args.seed).start()
+
+    import bot
+    from riot_client import AsyncRiotClient
+    bot.riot_client = AsyncRiotClient("bench", max_concurrency=bot.RIOT_MAX_CONCURRENCY, base_url=server.base_url)
+
+    report = {"users": args.users, "server": {}}
+    try:
+        link = await bench_link(bot, fixtures, args.link_samples, args.link_concurrency)
+        sent = dict(server.requests)
+        report["link"] = {
+            "samples": len(link["latencies"]),
+            "p50": percentile(link["latencies"], 50),
+            "p95": percentile(link["latencies"], 95),
+            "mean": statistics.mean(link["latencies"]) if link["latencies"] else 0.0,
+            "wall": link["wall"],
+            "requests": sum(sent.values()),
+            "statuses": link["statuses"],
+        }
+        server.requests.clear()
+
+        if args.mongo:
+            audit = await bench_audit(bot, fixtures, args.mongo, args.users)
+            report["audit"] = {**audit, "requests": sum(server.requests.values()),
+                               "users_per_sec": audit["users"] / audit["wall"] if audit["wall"] else 0.0}
+        report["server"] = {str(k): v for k, v in server.statuses.items()}
+    finally:
+        await bot.riot_client.close()
+        await server.stop()
+
+    lines = [f"=== ベンチマーク結果 (名簿 {args.users} 人) ==="]
+    if "link" in report:
+        l = report["link"]
+        lines.append(f"[link]  {l['samples']}件 p50={l['p50'] * 1000:.0f}ms p95={l['p95'] * 1000:.0f}ms "
+                     f"wall={l['wall']:.2f}s requests={l['requests']} status={l['statuses']}")
+    if "audit" in report:
+        a = report["audit"]
+        lines.append(f"[audit] {a['users']}人 wall={a['wall']:.2f}s requests={a['requests']} "
+                     f"({a['users_per_sec']:.1f} 人/秒)")
+    lines.append(f"[server] HTTP status: {report['server']}")
+    print("\n".join(lines))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Riot API を使わない /link・/audit のベンチマーク")
+    parser.add_argument("--users", type=int, default=100, help="名簿の人数 (10〜10000 程度)")
+    parser.add_argument("--link-samples", type=int, default=20, help="/link 相当の分析を何人ぶん計測するか")
+    parser.add_argument("--link-concurrency", type=int, default=1, help="/link を同時に何件走らせるか")
+    parser.add_argument("--fixtures", help="記録済みフィクスチャの JSON (省略時は自動生成)")
+    parser.add_argument("--mongo", help="/audit を計測する場合の MongoDB URL")
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--app-limits", default="500:10,30000:600", help="代替サーバーのレート制限")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--rate-cloudflare", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    asyncio.run(main(parser.parse_args()))
@@ -2,17 +2,33 @@ import discord
 import asyncio
 import traceback
 import os
-import csv
-import io
 import datetime
 import certifi
+import io
 import time
+import random
 import requests
 from discord.ext import commands
 from discord.ui import Button, View, Select
-from riotwatcher import LolWatcher, RiotWatcher, ApiError
-from pymongo import MongoClient
-from keep_alive import keep_alive
+from riot_client import AsyncRiotClient, RiotApiError, CircuitOpenError, METHOD_SUMMONER, endpoint_of
+from rate_limiter import limiter, priority, PRIORITY_BACKGROUND
+from match_cache import MatchCache, init_match_collection, compact_match
+from db_repository import UserRepository, MONGO_OPTIONS, LEADERBOARD_CACHE_SIZE, run_db
+from exporter import export_members, EXPORT_FORMATS, Workbook
+from cache_utils import TTLCache, SingleFlight
+from identity_cache import IdentityResolver, riot_key
+from player_stats import PlayerStatsStore, PLAYER_STATS_COLLECTION, WINDOW_SIZE, empty_state, merge_games
+from stats_engine import game_metrics_batch, summarize
+from stats_history import StatsHistory, STATS_HISTORY_COLLECTION, TREND_WINDOWS
+from guild_config import GuildConfig, GuildConfigStore, GUILD_CONFIG_COLLECTION
+from job_queue import JobQueue, JOB_COLLECTION
+from rescore import rescore, describe, THRESHOLD_KEYS, THRESHOLD_LABELS
+from tracing import span, traced, trace, start_trace, finish_trace, phase_stats, slowest, profiler, profiles
+from bulk_import import parse_import_csv, classify, row_reason, build_report_csv, BUCKET_LABELS, BUCKET_APPROVE, \
+    BUCKET_REVIEW, BUCKET_GRADUATE, BUCKET_ERROR
+from pymongo import MongoClient, UpdateOne
+from keep_alive import keep_alive, health_checks
+from metrics import RIOT_RETRIES, DB_LATENCY, COMMAND_LATENCY, LOOP_LAG
 
 # ==========================================
 # 設定項目
@@ -20,17 +36,20 @@ from keep_alive import keep_alive
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 RIOT_API_KEY = os.getenv('RIOT_API_KEY')
 MONGO_URL = os.getenv('MONGO_URL')
+# Riot API の接続先 (ベンチマークではローカルの代替サーバーを指定する)
+RIOT_API_BASE = os.getenv('RIOT_API_BASE', 'https://{region}.api.riotgames.com')
 
 # 通知を送るチャンネルID
 LOG_CHANNEL_ID = 1464619103468916829
 
 # 管理者IDとサーバーID (取得失敗時は 0 になる)
+# サーバーごとの設定 (guild_config) が無い時、従来のサーバー (GUILD_ID。0 なら Bot が1サーバーだけに居る時のそのサーバー)
+# はこの管理者とログチャンネルを使う。複数サーバーに入れるなら GUILD_ID を設定しておく。
+# それ以外のサーバーは /set_admin などで設定するまでサーバーオーナーが管理者になる。
+# ADMIN_USER_ID は Bot 全体の運用者でもある (/shutdown できるのはこの人だけ)
 ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID', 0))
 GUILD_ID = int(os.getenv('GUILD_ID', 0))
 
-current_admin_id = ADMIN_USER_ID
-current_guild_id = GUILD_ID
-
 # ロール設定
 ROLE_MEMBER = "Member"
 ROLE_WAITING = "waiting_review"
@@ -39,10 +58,51 @@ ROLE_GRACE = "卒業猶予"
 
 REGION_PLATFORM = 'jp1'
 REGION_ACCOUNT = 'asia'
+# レベル上限の初期値 (サーバーごとに /set_max_level で変更できる)
 MAX_LEVEL = 150
 
-# モード設定
-current_mode = "BEGINNER"
+# 一括監査の設定 (実際の速度は Riot API のレート制限で決まる)
+AUDIT_CONCURRENCY = 10
+AUDIT_BATCH_SIZE = 100
+AUDIT_PROGRESS_INTERVAL = 5.0
+
+# 常時ローリング監査: 毎回 last_updated が古い順に数人ずつ確認する
+ROLLING_AUDIT_INTERVAL = 60
+ROLLING_AUDIT_MAX_BATCH = 50
+# 1回あたりに使ってよい API 残り枠の割合 (残りは /link などに残しておく)
+ROLLING_AUDIT_BUDGET_SHARE = 0.3
+
+# /list の1ページあたりの表示人数
+LIST_PAGE_SIZE = 10
+
+# /link の分析結果を使い回す時間 (秒) と件数
+LINK_CACHE_TTL = 300
+LINK_CACHE_SIZE = 256
+
+# 試合キャッシュの上限サイズ (超えた分は古い試合から自動で消える)
+MATCH_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+# 分析を別プロセスのワーカー (worker.py) に任せるか。ワーカーを起動していない時は 0 のまま (このプロセスで分析する)
+JOB_QUEUE_ENABLED = os.getenv('JOB_QUEUE', '0') == '1'
+# ワーカーの結果を待つ最大秒数
+LINK_JOB_TIMEOUT = 120
+AUDIT_JOB_TIMEOUT = 600
+IMPORT_JOB_TIMEOUT = 600
+# 監査ジョブ1件あたりの人数 (小さいほど多くのワーカーに分散する)
+AUDIT_JOB_SIZE = 25
+
+# /import の一括登録: 同時に分析する人数と、まとめて DB に保存する人数
+IMPORT_CONCURRENCY = 5
+IMPORT_BATCH_SIZE = 50
+
+# MongoDB 接続: 失敗したら 2秒, 4秒, 8秒... と間隔を広げて (最大 MONGO_RETRY_MAX 秒) 裏で再試行する
+MONGO_RETRY_BASE = 2.0
+MONGO_RETRY_MAX = 120.0
+# 接続後に生存確認をする間隔 (秒)。失敗したら DB なしモードに切り替えて再接続を待つ
+MONGO_PING_INTERVAL = 30
+
+# モード設定 (サーバーごとに /set_mode で変更できる。これは初期値)
+DEFAULT_MODE = "BEGINNER"
 THRESHOLDS = {
     "BEGINNER": {"name": "🔰 初心者帯 (Iron/Bronze)", "win_rate": 60, "kda": 4.0, "cspm": 7.0, "gpm": 450, "dmg": 30.0},
     "INTERMEDIATE": {"name": "🛡️ 中級者帯 (Silver/Gold)", "win_rate": 60, "kda": 4.5, "cspm": 7.5, "gpm": 500,
@@ -56,16 +116,13 @@ THRESHOLDS = {
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix='/', intents=intents)
-
-api_config = {"timeout": 20.0}
+# サーバー数が増えたらシャード数は Discord の推奨値に合わせて自動で決まる
+bot = commands.AutoShardedBot(command_prefix='/', intents=intents)
 
-if not RIOT_API_KEY:
-    lol_watcher = LolWatcher('dummy', **api_config)
-    riot_watcher = RiotWatcher('dummy', **api_config)
-else:
-    lol_watcher = LolWatcher(RIOT_API_KEY, timeout=20.0)
-    riot_watcher = RiotWatcher(RIOT_API_KEY, timeout=20.0)
+# 試合詳細を同時に取りに行く最大数
+RIOT_MAX_CONCURRENCY = 10
+riot_client = AsyncRiotClient(RIOT_API_KEY or 'dummy', timeout=20.0, max_concurrency=RIOT_MAX_CONCURRENCY,
+                              base_url=RIOT_API_BASE)
 
 # ==========================================
 # MongoDB接続
@@ -73,172 +130,315 @@ else:
 mongo_client = None
 db = None
 users_col = None
+users_repo = UserRepository()
+audit_col = None
+# サーバーID -> 一括監査のロック
+audit_locks = {}
+mongo_task = None
+rolling_audit_task = None
+loop_lag_task = None
+match_cache = MatchCache()
+stats_store = PlayerStatsStore()
+stats_history = StatsHistory()
+job_queue = JobQueue()
+link_cache = TTLCache(maxsize=LINK_CACHE_SIZE, ttl=LINK_CACHE_TTL, name="link")
+link_flight = SingleFlight()
+# 同じ試合を複数の分析が同時に取りに行かないようにする (一括登録で同じ試合を共有する人が多い)
+match_flight = SingleFlight()
+# ダッシュボードに出す管理者名 (管理者ID -> 名前)
+dashboard_admins = {}
+identity_resolver = IdentityResolver(users_repo)
+
+
+def guild_defaults(guild_id):
+    # 環境変数の管理者・ログチャンネルは従来の1サーバーだけに使う。他のサーバーはオーナーが管理者になる
+    legacy = guild_id == legacy_guild_id()
+    return {"mode": DEFAULT_MODE, "max_level": MAX_LEVEL, "admin_id": ADMIN_USER_ID if legacy else 0,
+            "log_channel_id": LOG_CHANNEL_ID if legacy else 0}
+
+
+guild_configs = GuildConfigStore(THRESHOLDS, guild_defaults)
+
+# 起動時には接続を待たない。Discord へのログインを先に済ませ、接続は mongo_keeper が裏で行う。
+# 未接続の間は各コレクションが None のままなので、コマンドは DB なしモードで動く。
+
+
+def legacy_guild_id():
+    # サーバー対応前のデータ (guild_id 無し) をどのサーバーのものとみなすか。決められなければ None
+    if GUILD_ID: return GUILD_ID
+    return bot.guilds[0].id if len(bot.guilds) == 1 else None
+
+
+def connect_mongo(legacy_guild):
+    # 同期 (スレッドプールで実行する)。MongoClient は一度作れば内部で自動的に再接続する
+    global mongo_client
+    if mongo_client is None:
+        mongo_client = MongoClient(MONGO_URL, tlsCAFile=certifi.where(), **MONGO_OPTIONS)
+    mongo_client.server_info()
+    db = mongo_client.lol_bot_db
+    repo = UserRepository(db.users)
+    if legacy_guild is not None:
+        migrated = repo.migrate_legacy(legacy_guild).modified_count
+        if migrated: print(f"🔁 旧形式の登録 {migrated} 件をサーバー {legacy_guild} に移行しました")
+    try:
+        repo.create_indexes()
+        JobQueue(db[JOB_COLLECTION]).create_indexes()
+    except Exception as e:
+        print(f"⚠️ インデックス作成スキップ: {e}")
+    return db, init_match_collection(db, MATCH_CACHE_MAX_BYTES)
+
+
+def attach_mongo(new_db, match_col):
+    global db, users_col, audit_col
+    db = new_db
+    users_col = db.users
+    users_repo.collection = users_col
+    audit_col = db.audit_state
+    match_cache.collection = match_col
+    stats_store.collection = db[PLAYER_STATS_COLLECTION]
+    stats_history.collection = db[STATS_HISTORY_COLLECTION]
+    guild_configs.collection = db[GUILD_CONFIG_COLLECTION]
+    job_queue.collection = db[JOB_COLLECTION]
+
+
+def detach_mongo():
+    # DB なしモードに戻す
+    global users_col, audit_col
+    users_col = None
+    users_repo.collection = None
+    audit_col = None
+    match_cache.collection = None
+    stats_store.collection = None
+    stats_history.collection = None
+    guild_configs.collection = None
+    job_queue.collection = None
+
+
+async def mongo_keeper():
+    # 接続できるまで指数バックオフで再試行し、接続後は定期的に ping して切断を検知する
+    failures = 0
+    while not bot.is_closed():
+        if not users_repo.available:
+            try:
+                print(f"🔌 MongoDBに接続中... ({failures + 1}回目)")
+                attach_mongo(*await run_db(connect_mongo, legacy_guild_id(), db_timeout=30.0, db_op="connect"))
+                print("✅ MongoDB接続成功！")
+                failures = 0
+                await resume_interrupted_audit()
+                continue
+            except Exception as e:
+                failures += 1
+                delay = min(MONGO_RETRY_BASE * 2 ** (failures - 1), MONGO_RETRY_MAX) * random.uniform(0.8, 1.2)
+                print(f"⚠️ MongoDB接続失敗: {e} ({delay:.0f}秒後に再試行、それまでDB機能なしで動作)")
+                await asyncio.sleep(delay)
+                continue
 
-if MONGO_URL:
-    for attempt in range(1, 4):
+        await asyncio.sleep(MONGO_PING_INTERVAL)
         try:
-            print(f"🔌 MongoDBに接続中... ({attempt}回目)")
-            mongo_client = MongoClient(
-                MONGO_URL,
-                tlsCAFile=certifi.where(),
-                serverSelectionTimeoutMS=30000,
-                connectTimeoutMS=30000,
-                socketTimeoutMS=None
-            )
-            mongo_client.server_info()
-            db = mongo_client.lol_bot_db
-            users_col = db.users
-            print("✅ MongoDB接続成功！")
-            break
+            await run_db(mongo_client.admin.command, "ping", db_op="ping")
         except Exception as e:
-            print(f"⚠️ 接続失敗 ({attempt}/3): {e}")
-            if attempt < 3:
-                time.sleep(5)
-            else:
-                print("❌ MongoDBへの接続を諦めました。DB機能なしで起動します。")
+            print(f"⚠️ MongoDBとの接続が切れました。DB機能なしで動作し、再接続を試みます: {e}")
+            detach_mongo()
 
 
 # ==========================================
 # 補助関数
 # ==========================================
-def is_admin_or_owner(ctx_or_interaction):
+async def is_admin_or_owner(ctx_or_interaction):
     user = ctx_or_interaction.author if isinstance(ctx_or_interaction, commands.Context) else ctx_or_interaction.user
     guild = ctx_or_interaction.guild
-    return user.id == current_admin_id or user.id == guild.owner_id
-
-
-def save_user_to_db(discord_id, riot_name, riot_tag, puuid, level, stats=None):
-    if users_col is None: return
+    if guild is None: return False
+    cfg = await guild_configs.get(guild.id)
+    return cfg.is_admin(user.id, guild) or user.id == guild.owner_id
+
+
+async def is_guild_admin(ctx):
+    # 承認・卒業など管理者本人だけが行う操作 (管理者未設定ならサーバーオーナー)
+    if ctx.guild is None: return False
+    return (await guild_configs.get(ctx.guild.id)).is_admin(ctx.author.id, ctx.guild)
+
+
+def log_channel_for(guild, cfg):
+    # 他のサーバーのチャンネルには送らない
+    channel = bot.get_channel(cfg.log_channel_id) if cfg.log_channel_id else None
+    return channel if channel is not None and channel.guild.id == guild.id else None
+
+
+def build_user_update(riot_name, riot_tag, puuid, level, stats=None, identity_checked_at=None):
+    # users に $set する内容 (一括登録でも同じものを使う)
+    now = datetime.datetime.now()
+    update_data = {
+        "riot_name": riot_name,
+        "riot_tag": riot_tag,
+        "riot_key": riot_key(riot_name, riot_tag),
+        "puuid": puuid,
+        "level": level,
+        "last_updated": now
+    }
+    if identity_checked_at: update_data["identity_checked_at"] = identity_checked_at
+    if stats: update_data.update(stats)
+    return update_data
+
+
+async def save_user_to_db(guild_id, discord_id, riot_name, riot_tag, puuid, level, stats=None,
+                          identity_checked_at=None):
+    # 新しく登録した (人数が増えた) なら True
+    if not users_repo.available: return False
     try:
-        now = datetime.datetime.now()
-        update_data = {
-            "riot_name": riot_name,
-            "riot_tag": riot_tag,
-            "puuid": puuid,
-            "level": level,
-            "last_updated": now
-        }
-        if stats: update_data.update(stats)
-        # timeoutオプションを削除して安定性向上
-        users_col.update_one({"discord_id": discord_id}, {"$set": update_data}, upsert=True)
+        with span("db.save_user"):
+            update_data = build_user_update(riot_name, riot_tag, puuid, level, stats, identity_checked_at)
+            with DB_LATENCY.time(op="save_user_to_db"):
+                result = await users_repo.upsert(guild_id, discord_id, update_data)
         print(f"💾 DB保存完了: {riot_name}#{riot_tag}")
+        return result.upserted_id is not None
     except Exception as e:
         print(f"⚠️ DB保存スキップ: {e}")
+        return False
 
 
-# Riot API用リトライ関数
-def call_riot_api(func, *args, **kwargs):
-    max_retries = 3
-    for i in range(max_retries):
-        try:
-            return func(*args, **kwargs)
-        except Exception as e:
-            if isinstance(e, ApiError):
-                # 500番台のエラーはRiot側の問題なのでリトライ対象
-                if e.response.status_code in [404, 403]:
-                    raise e
+# Riot API用リトライ関数 (イベントループを止めないよう await で待機)
+# エラーの種類ごとに扱いを変える:
+#   429          … リミッターが Retry-After の間その枠を止めているので、すぐ再送すればリミッターが待たせる
+#   5xx・通信エラー … 0.5秒, 1秒, 2秒... (最大 RIOT_RETRY_MAX 秒) の範囲でランダムに待ってから再送する
+#   4xx (404 など) … 何度送っても同じなので再試行しない
+#   遮断中         … サーキットブレーカーが開いているので再試行しない
+RIOT_MAX_RETRIES = 3
+RIOT_RETRY_BASE = 0.5
+RIOT_RETRY_MAX = 8.0
 
-            err_str = str(e)
-            if "<html" in err_str or "Cloudflare" in err_str:
-                print(f"⚠️ Cloudflare/Server Error (再試行 {i + 1}/{max_retries})")
-            else:
-                print(f"⚠️ 通信エラー (再試行 {i + 1}/{max_retries}): {e}")
 
-            if i < max_retries - 1:
-                time.sleep(2)
+async def call_riot_api(func, *args, **kwargs):
+    for i in range(RIOT_MAX_RETRIES):
+        last = i == RIOT_MAX_RETRIES - 1
+        try:
+            return await func(*args, **kwargs)
+        except CircuitOpenError:
+            raise
+        except RiotApiError as e:
+            if e.status_code == 429:
+                print(f"⚠️ レート制限 (再試行 {i + 1}/{RIOT_MAX_RETRIES})")
+                if last: raise
+                RIOT_RETRIES.inc(endpoint=endpoint_of(func), reason="429")
+                continue
+            if not e.upstream_failure: raise
+            if "<html" in e.text or "Cloudflare" in e.text:
+                reason = "cloudflare"
+                print(f"⚠️ Cloudflare/Server Error (再試行 {i + 1}/{RIOT_MAX_RETRIES})")
             else:
-                raise e
+                reason = "timeout" if e.status_code == 0 else "5xx"
+                print(f"⚠️ 通信エラー (再試行 {i + 1}/{RIOT_MAX_RETRIES}): {e}")
+            if last: raise
+        except Exception as e:
+            print(f"⚠️ 通信エラー (再試行 {i + 1}/{RIOT_MAX_RETRIES}): {e}")
+            if last: raise
+            reason = "error"
+        RIOT_RETRIES.inc(endpoint=endpoint_of(func), reason=reason)
+        # フルジッター: 一斉に再送して復旧直後の Riot に負荷をかけないようにする
+        await asyncio.sleep(random.uniform(0, min(RIOT_RETRY_BASE * 2 ** i, RIOT_RETRY_MAX)))
 
 
 # ==========================================
 # 分析ロジック (KeyError修正版)
 # ==========================================
-async def analyze_player_stats(riot_id_name, riot_id_tag, discord_id_for_save=None, is_exempt=False):
-    config = THRESHOLDS[current_mode]
+async def analyze_player_stats(riot_id_name, riot_id_tag, discord_id_for_save=None, is_exempt=False, cfg=None):
+    # cfg はサーバーごとの設定 (省略時は初期設定)。保存先もそのサーバーになる
+    cfg = cfg or GuildConfig(0, THRESHOLDS, **guild_defaults(0))
+    config = cfg.thresholds
     riot_id_combined = f"{riot_id_name}#{riot_id_tag}"  # 先に定義しておく
 
     try:
-        try:
-            account = call_riot_api(riot_watcher.account.by_riot_id, REGION_ACCOUNT, riot_id_name, riot_id_tag)
-        except ApiError as err:
-            if err.response.status_code == 404:
-                return {"status": "ERROR", "reason": "❌ プレイヤーが見つかりません。IDを確認してください。"}
-            elif err.response.status_code == 403:
-                return {"status": "ERROR", "reason": "❌ APIキーが無効です。"}
-            raise
-
-        puuid = account.get('puuid')
-        if not puuid: return {"status": "ERROR", "reason": "❌ PUUID取得失敗", "data": locals()}
-
-        summoner = call_riot_api(lol_watcher.summoner.by_puuid, REGION_PLATFORM, puuid)
+        # 既知のプレイヤーは account-v1 を呼ばずに PUUID を解決する
+        with span("db.identity"):
+            identity = await identity_resolver.lookup(riot_id_name, riot_id_tag)
+        if identity:
+            puuid, identity_checked_at = identity
+        else:
+            try:
+                with span("riot.account"):
+                    account = await call_riot_api(riot_client.account_by_riot_id, REGION_ACCOUNT, riot_id_name,
+                                                  riot_id_tag)
+            except RiotApiError as err:
+                if err.status_code == 404:
+                    return {"status": "ERROR", "reason": "❌ プレイヤーが見つかりません。IDを確認してください。"}
+                elif err.status_code == 403:
+                    return {"status": "ERROR", "reason": "❌ APIキーが無効です。"}
+                raise
+
+            puuid = account.get('puuid')
+            if not puuid: return {"status": "ERROR", "reason": "❌ PUUID取得失敗", "data": locals()}
+            identity_checked_at = datetime.datetime.now()
+            identity_resolver.remember(riot_id_name, riot_id_tag, puuid, identity_checked_at)
+
+        # 前回までの集計を読み、それより新しい試合IDだけを取得する
+        async def fetch_new_match_ids():
+            with span("db.stats_load"):
+                state = await stats_store.load(puuid) or empty_state(puuid)
+            start_time = state["last_match_time"] // 1000 + 1 if state["last_match_time"] else None
+            with span("riot.matchlist"):
+                ids = await call_riot_api(riot_client.matchlist_by_puuid, REGION_ACCOUNT, puuid,
+                                          count=WINDOW_SIZE, start_time=start_time)
+            return state, ids
+
+        # サモナー情報と試合リストはどちらも PUUID だけで取れるので同時に取得する
+        summoner, (state, matches) = await asyncio.gather(
+            traced("riot.summoner", call_riot_api(riot_client.summoner_by_puuid, REGION_PLATFORM, puuid)),
+            fetch_new_match_ids()
+        )
         acct_level = summoner.get('summonerLevel', 0)
 
+        # DB に保存する内容 (共有された分析結果から呼び出し元ごとに保存できるよう結果にも含める)
+        profile = {"riot_name": riot_id_name, "riot_tag": riot_id_tag, "puuid": puuid, "level": acct_level,
+                   "identity_checked_at": identity_checked_at}
         if discord_id_for_save:
-            save_user_to_db(discord_id_for_save, riot_id_name, riot_id_tag, puuid, acct_level)
+            await save_user_to_db(cfg.guild_id, discord_id_for_save, **profile)
 
-        if not is_exempt and acct_level >= MAX_LEVEL:
+        if not is_exempt and acct_level >= cfg.max_level:
             return {"status": "GRADUATE", "reason": f"🎓 レベル上限超過 (Lv.{acct_level})",
-                    "data": {"riot_id": riot_id_combined, "level_raw": acct_level}}
-
-        matches = call_riot_api(lol_watcher.match.matchlist_by_puuid, REGION_ACCOUNT, puuid, count=20)
-        if not matches:
-            return {"status": "REVIEW", "reason": "⚠️ 直近の試合データなし", "data": locals()}
-
-        wins = 0;
-        valid = 0
-        kills = 0;
-        deaths = 0;
-        assists = 0
-        cspm = 0;
-        gpm = 0;
-        dmg_share = 0
-        troll_deaths = 0;
-        troll_items = 0;
-        troll_dmg = 0;
-        troll_ff = 0
-
-        for match_id in matches:
-            await asyncio.sleep(0.5)
-            try:
-                match = call_riot_api(lol_watcher.match.by_id, REGION_ACCOUNT, match_id)
-            except:
-                continue
-
-            info = match['info']
-            if info['gameDuration'] < 300: continue
-
-            valid += 1
-            duration_min = info['gameDuration'] / 60
-
-            me = next((p for p in info['participants'] if p['puuid'] == puuid), None)
-            if not me: continue
-
-            team_dmg = sum(
-                p['totalDamageDealtToChampions'] for p in info['participants'] if p['teamId'] == me['teamId'])
-
-            if me['win']:
-                wins += 1
-            elif info['gameDuration'] < 1200:
-                troll_ff += 1
-
-            kills += me['kills']
-            deaths += me['deaths']
-            assists += me['assists']
-
-            cs = me['totalMinionsKilled'] + me['neutralMinionsKilled']
-            cspm += cs / duration_min
-            gpm += me['goldEarned'] / duration_min
-
-            if team_total_dmg := team_dmg:
-                dmg_share += (me['totalDamageDealtToChampions'] / team_total_dmg) * 100
-
-            if me['deaths'] >= 12: troll_deaths += 1
-            item_cnt = sum(1 for i in range(6) if me.get(f'item{i}', 0) != 0)
-            if item_cnt <= 1 and duration_min > 10: troll_items += 1
-            if team_total_dmg > 0 and (me['totalDamageDealtToChampions'] / team_total_dmg) * 100 < 5.0: troll_dmg += 1
+                    "data": {"riot_id": riot_id_combined, "level_raw": acct_level}, "profile": profile}
+
+        known = {g["id"] for g in state["games"]}
+        new_ids = [m for m in matches if m not in known]
+        if not new_ids and not state["games"]:
+            return {"status": "REVIEW", "reason": "⚠️ 直近の試合データなし", "data": locals(), "profile": profile}
+
+        # キャッシュ済みの試合は再取得しない
+        with span("db.match_cache_get"):
+            cached = await match_cache.get_many(new_ids)
+        missing = [m for m in new_ids if m not in cached]
+
+        # 残りの試合詳細はまとめて並行取得 (同時接続数は riot_client 側で制限)。他の分析が取得中の試合はその結果を待つ
+        fetched = await asyncio.gather(
+            *(match_flight.run(match_id, lambda m=match_id: traced(
+                "riot.match_by_id", call_riot_api(riot_client.match_by_id, REGION_ACCOUNT, m)))
+              for match_id in missing),
+            return_exceptions=True
+        )
+        new_docs = {m: compact_match(m, r) for m, r in zip(missing, fetched) if not isinstance(r, Exception)}
+        fetched_all = len(missing) == len(new_docs)
+        with span("db.match_cache_put"):
+            await match_cache.put_many(new_docs.values())
+
+        with span("stats.compute"):
+            records = []
+            newest_time = state["last_match_time"]
+            for match_id in new_ids:
+                match = cached.get(match_id) or new_docs.get(match_id)
+                if match is None: continue
+                newest_time = max(newest_time, match['info'].get('gameCreation', 0))
+                records.append((match_id, match['info'], puuid))
+            merge_games(state, game_metrics_batch(records))
+
+        # 取得に失敗した試合があれば、次回もう一度取り直せるよう位置は進めない
+        if new_ids and fetched_all:
+            state["last_match_id"] = new_ids[0]
+            state["last_match_time"] = newest_time
+            with span("db.stats_save"):
+                await stats_store.save(state)
+
+        summary = summarize(state["sums"])
 
         # データ不足時のクラッシュ対策
-        if valid == 0:
+        if summary is None:
             # データ不足時でも必要な情報をダミーで埋めて返す
             safe_data = {
                 "riot_id": riot_id_combined,
@@ -249,17 +449,28 @@ async def analyze_player_stats(riot_id_name, riot_id_tag, discord_id_for_save=No
                 "troll": "不明(APIエラー)",
                 "matches": 0
             }
-            return {"status": "REVIEW", "reason": "⚠️ Riotサーバー不調のため詳細データ取得不能", "data": safe_data}
-
-        win_rate = (wins / valid) * 100
-        avg_kda = (kills + assists) / (deaths if deaths > 0 else 1)
-        avg_cspm = cspm / valid
-        avg_gpm = gpm / valid
-        avg_dmg = dmg_share / valid
-
+            return {"status": "REVIEW", "reason": "⚠️ Riotサーバー不調のため詳細データ取得不能", "data": safe_data,
+                    "profile": profile}
+
+        win_rate = summary["win_rate"]
+        avg_kda = summary["kda"]
+        avg_cspm = summary["cspm"]
+        avg_gpm = summary["gpm"]
+        avg_dmg = summary["dmg"]
+
+        # sums は基準変更時の再採点 (/rescore) 用に、そのままの合計値も保存する
+        profile["stats"] = {"win_rate": win_rate, "kda": avg_kda, "gpm": avg_gpm, "cspm": avg_cspm, "dmg": avg_dmg,
+                            "matches": summary["matches"], "sums": dict(state["sums"])}
+        # 履歴への追記は新しい試合をすべて取り込めた時だけ (集計を保存する条件と同じ)。試合が増えていない
+        # 再分析で同じ値を追記すると、平均が試合数ではなく分析した回数で重み付けされてしまうため。
+        # その時点の 7日 / 30日の集計も stats に含めて users に保存する
+        if new_ids and fetched_all:
+            trend = await stats_history.record(puuid, profile["stats"])
+        else:
+            trend = await stats_history.trend(puuid)
+        if trend: profile["stats"]["trend"] = trend
         if discord_id_for_save:
-            stats_data = {"win_rate": win_rate, "kda": avg_kda, "gpm": avg_gpm}
-            save_user_to_db(discord_id_for_save, riot_id_name, riot_id_tag, puuid, acct_level, stats=stats_data)
+            await save_user_to_db(cfg.guild_id, discord_id_for_save, **profile)
 
         def fmt(val, thresh, unit="", low_bad=False):
             s = f"{round(val, 1)}"
@@ -268,11 +479,7 @@ async def analyze_player_stats(riot_id_name, riot_id_tag, discord_id_for_save=No
             display_str = f"{s}/{t}{unit}"
             return f"⚠️ **{display_str}**" if is_bad else display_str
 
-        trolls = []
-        if troll_deaths >= valid * 0.3: trolls.append(f"💀OverDeath({troll_deaths})")
-        if troll_items >= 1: trolls.append(f"💀NoItem")
-        if troll_dmg >= 2: trolls.append(f"💀LowDmg")
-        if (valid - wins) > 0 and (troll_ff / (valid - wins)) >= 0.5: trolls.append(f"💀EarlyFF")
+        trolls = summary["trolls"]
 
         data_snapshot = {
             "riot_id": riot_id_combined,
@@ -284,19 +491,25 @@ async def analyze_player_stats(riot_id_name, riot_id_tag, discord_id_for_save=No
             "fmt_gpm": fmt(avg_gpm, config["gpm"]),
             "fmt_dmg": fmt(avg_dmg, config["dmg"], "%"),
             "troll": " / ".join(trolls) if trolls else "なし",
-            "matches": valid
+            "matches": summary["matches"]
         }
-        return {"status": "REVIEW", "reason": "完了", "data": data_snapshot}
+        # complete: 取得に失敗した試合が無い (一部欠けた集計は使い回さない)
+        return {"status": "REVIEW", "reason": "完了", "data": data_snapshot, "profile": profile,
+                "complete": fetched_all}
 
     except Exception as e:
         err_str = str(e)
         if "<html" in err_str:
             print("❌ Cloudflare HTML Error detected in logs.")
+        elif isinstance(e, CircuitOpenError):
+            print(f"🔌 遮断中のため分析中止: {riot_id_combined} ({e.text})")
         else:
             print(traceback.format_exc())
 
         jp_error = "❌ 予期せぬエラー"
-        if "Connection" in err_str or "timeout" in err_str.lower() or "500" in err_str:
+        if isinstance(e, RiotApiError) and e.upstream_failure:
+            jp_error = "❌ Riotサーバーが不安定です（APIエラー）。"
+        elif "Connection" in err_str or "timeout" in err_str.lower() or "500" in err_str:
             jp_error = "❌ Riotサーバーが不安定です（APIエラー）。"
         else:
             jp_error = "❌ エラーが発生しました。"
@@ -304,6 +517,102 @@ async def analyze_player_stats(riot_id_name, riot_id_tag, discord_id_for_save=No
         return {"status": "ERROR", "reason": jp_error}
 
 
+# 同じ Riot ID の分析は同時実行をまとめ、結果も少しの間使い回す
+async def analyze_player_shared(riot_id_name, riot_id_tag, discord_id_for_save, is_exempt, cfg):
+    # 基準値が同じなら別サーバーからの分析もまとめる
+    key = (riot_key(riot_id_name, riot_id_tag), cfg.cache_key, is_exempt)
+    result = link_cache.get(key)
+    if result is None:
+        with span("analyze"):
+            result = await link_flight.run(
+                key, lambda: analyze_player_stats(riot_id_name, riot_id_tag, is_exempt=is_exempt, cfg=cfg))
+        # Riot 障害中の不完全な結果を使い回さないよう、全試合そろった分析だけキャッシュする
+        if result.get("reason") == "完了" and result.get("complete"): link_cache.put(key, result)
+
+    # 保存は呼び出し元 (サーバー × Discordユーザー) ごとに行う
+    profile = result.get("profile")
+    if discord_id_for_save and profile:
+        await save_user_to_db(cfg.guild_id, discord_id_for_save, **profile)
+    return result
+
+
+def use_job_queue():
+    return JOB_QUEUE_ENABLED and job_queue.available
+
+
+def link_job_payload(riot_id_name, riot_id_tag, discord_id, is_exempt, cfg):
+    # 判定基準もジョブに含める (ワーカーのサーバー設定キャッシュは Bot 本体での変更を知らない)
+    return {"name": riot_id_name, "tag": riot_id_tag, "discord_id": discord_id, "is_exempt": is_exempt,
+            "guild_id": cfg.guild_id, "mode": cfg.mode, "thresholds": cfg.thresholds, "max_level": cfg.max_level}
+
+
+async def request_link_analysis(riot_id_name, riot_id_tag, discord_id, is_exempt, cfg):
+    # ワーカーがいればジョブとして任せて結果を待ち、いなければ (DB 切断中も) このプロセスで分析する
+    if use_job_queue():
+        try:
+            job_id = await job_queue.enqueue("link", link_job_payload(riot_id_name, riot_id_tag, discord_id,
+                                                                      is_exempt, cfg))
+        except Exception as e:
+            print(f"⚠️ ジョブ登録失敗、この場で分析します: {e}")
+        else:
+            with span("jobs.link_wait"):
+                job = (await job_queue.wait([job_id], LINK_JOB_TIMEOUT)).get(job_id)
+            if job is None or job["status"] != "done":
+                return {"status": "ERROR", "reason": "❌ 分析が混み合っています。しばらくしてから再度お試しください。"}
+            # 保存はワーカーが済ませているので、ランキングと人数のキャッシュだけ捨てる
+            users_repo.external_write(cfg.guild_id, int(job["result"].get("upserted", False)))
+            return job["result"]
+    return await analyze_player_shared(riot_id_name, riot_id_tag, discord_id, is_exempt, cfg)
+
+
+# ==========================================
+# 再採点 (保存済みの合計値で基準を当て直す、Riot API は使わない)
+# ==========================================
+def clip_lines(lines, limit=1000):
+    # Embed のフィールド上限に収まるところまで並べ、残りは人数だけ出す
+    shown, size = [], 0
+    for line in lines:
+        if size + len(line) + 1 > limit: break
+        shown.append(line)
+        size += len(line) + 1
+    if len(shown) < len(lines): shown.append(f"…ほか {len(lines) - len(shown)}人")
+    return "\n".join(shown) or "なし"
+
+
+async def report_rescore(send, guild, old, new):
+    # 名簿全体を新旧の基準で判定し直し、基準を超える / 超えなくなる人を送る (DB 未接続なら False)
+    if not users_repo.available: return False
+    try:
+        members = await users_repo.find({"guild_id": guild.id},
+                                        {"discord_id": 1, "riot_name": 1, "riot_tag": 1, "sums": 1})
+        started = time.perf_counter()
+        results = rescore(members, old, new)
+        elapsed = time.perf_counter() - started
+    except Exception as e:
+        print(f"⚠️ 再採点失敗: {e}")
+        return False
+
+    def line(r, keys):
+        m = r["member"]
+        return f"<@{m['discord_id']}> ({m.get('riot_name', '?')}): {describe(r, new, keys)}"
+
+    added = [line(r, r["added"]) for r in results if r["added"]]
+    cleared = [f"<@{r['member']['discord_id']}> ({r['member'].get('riot_name', '?')}): "
+               f"{', '.join(THRESHOLD_LABELS[k] for k in THRESHOLD_KEYS if k in r['cleared'])}"
+               for r in results if r["cleared"]]
+    counts = " / ".join(f"{THRESHOLD_LABELS[k]} {sum(k in r['crossed'] for r in results)}人" for k in THRESHOLD_KEYS)
+    embed = discord.Embed(title="🧮 再採点結果", color=discord.Color.orange(),
+                          description=f"{old['name']} → {new['name']}\n"
+                                      f"対象 {len(results)}人 / 未集計 {len(members) - len(results)}人 "
+                                      f"({elapsed * 1000:.0f}ms, API呼び出しなし)")
+    embed.add_field(name="📊 基準超えの人数 (変更後)", value=counts, inline=False)
+    embed.add_field(name=f"⚠️ 新たに基準超え ({len(added)}人)", value=clip_lines(added), inline=False)
+    embed.add_field(name=f"✅ 基準内に戻る ({len(cleared)}人)", value=clip_lines(cleared), inline=False)
+    embed.set_footer(text="未集計: 集計値の保存前に登録されたメンバー (再度分析すると対象になります)")
+    await send(embed=embed)
+    return True
+
+
 # ==========================================
 # UI & コマンド
 # ==========================================
@@ -322,48 +631,113 @@ class DashboardView(View):
         ]
     )
     async def select_mode(self, interaction: discord.Interaction, select: Select):
-        if not is_admin_or_owner(interaction): return await interaction.response.send_message("❌ 権限がありません。",
-                                                                                              ephemeral=True)
-        global current_mode
-        current_mode = select.values[0]
-        await interaction.response.send_message(f"✅ モードを変更しました: **{THRESHOLDS[current_mode]['name']}**",
+        if not await is_admin_or_owner(interaction):
+            return await interaction.response.send_message("❌ 権限がありません。", ephemeral=True)
+        old = (await guild_configs.get(interaction.guild.id)).thresholds
+        cfg = await guild_configs.update(interaction.guild.id, mode=select.values[0])
+        await interaction.response.send_message(f"✅ モードを変更しました: **{cfg.thresholds['name']}**",
                                                 ephemeral=True)
+        await report_rescore(lambda **kw: interaction.followup.send(ephemeral=True, **kw), interaction.guild, old,
+                             cfg.thresholds)
         await update_dashboard(interaction, self.ctx)
 
     @discord.ui.button(label="一括監査", style=discord.ButtonStyle.danger, emoji="🔍")
     async def audit_button(self, interaction: discord.Interaction, button: Button):
-        if not is_admin_or_owner(interaction): return await interaction.response.send_message("❌ 権限がありません。",
-                                                                                              ephemeral=True)
+        if not await is_admin_or_owner(interaction):
+            return await interaction.response.send_message("❌ 権限がありません。", ephemeral=True)
         await interaction.response.send_message("⏳ 監査を開始します...", ephemeral=True)
         await run_audit_logic(self.ctx)
 
     @discord.ui.button(label="CSV出力", style=discord.ButtonStyle.success, emoji="📥")
     async def export_button(self, interaction: discord.Interaction, button: Button):
-        if not is_admin_or_owner(interaction): return await interaction.response.send_message("❌ 権限がありません。",
-                                                                                              ephemeral=True)
-        if not users_col: return await interaction.response.send_message("❌ データベース未接続", ephemeral=True)
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Name', 'ID', 'Riot ID', 'Level', 'Link'])
-        for u in users_col.find():
-            name_safe = u['riot_name'].replace(" ", "%20")
-            url = f"https://www.op.gg/summoners/jp/{name_safe}-{u['riot_tag']}"
-            u_obj = self.ctx.guild.get_member(u['discord_id'])
-            d_name = u_obj.name if u_obj else "Unknown"
-            writer.writerow([d_name, u['discord_id'], f"{u['riot_name']}#{u['riot_tag']}", u['level'], url])
-        output.seek(0)
-        await interaction.response.send_message("📊 出力完了", file=discord.File(output, "members.csv"), ephemeral=True)
+        if not await is_admin_or_owner(interaction):
+            return await interaction.response.send_message("❌ 権限がありません。", ephemeral=True)
+        if not users_repo.available: return await interaction.response.send_message("❌ データベース未接続", ephemeral=True)
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        for files in await build_export_files(self.ctx.guild, "csv"):
+            await interaction.followup.send("📊 出力完了", files=files, ephemeral=True)
 
     @discord.ui.button(label="更新", style=discord.ButtonStyle.secondary, emoji="🔄")
     async def refresh_button(self, interaction: discord.Interaction, button: Button):
         await update_dashboard(interaction, self.ctx)
 
 
+class MemberListView(View):
+    def __init__(self, ctx):
+        super().__init__(timeout=300)
+        self.ctx = ctx
+        # 各ページの直前の _id (先頭ページは None)。戻る時はこれを積み下ろす
+        self.page_starts = [None]
+        self.last_id = None
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        return interaction.user.id == self.ctx.author.id
+
+    async def render(self):
+        projection = {"discord_id": 1, "riot_name": 1, "riot_tag": 1, "level": 1}
+        users = await users_repo.find_after(self.ctx.guild.id, self.page_starts[-1], LIST_PAGE_SIZE + 1, projection)
+        has_next = len(users) > LIST_PAGE_SIZE
+        users = users[:LIST_PAGE_SIZE]
+        self.last_id = users[-1]['_id'] if users else self.page_starts[-1]
+
+        msg = f"**📋 メンバー一覧** (ページ {len(self.page_starts)})\n"
+        for u in users:
+            url = f"https://www.op.gg/summoners/jp/{u['riot_name'].replace(' ', '%20')}-{u['riot_tag']}"
+            d_user = self.ctx.guild.get_member(u['discord_id'])
+            d_name = d_user.display_name if d_user else "退室済み"
+            msg += f"• **{d_name}**: [{u['riot_name']}#{u['riot_tag']}]({url}) (Lv.{u['level']})\n"
+        if not users: msg += "データなし"
+
+        self.prev_button.disabled = len(self.page_starts) == 1
+        self.next_button.disabled = not has_next
+        return msg
+
+    @discord.ui.button(label="前へ", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def prev_button(self, interaction: discord.Interaction, button: Button):
+        if len(self.page_starts) > 1: self.page_starts.pop()
+        await interaction.response.edit_message(content=await self.render(), view=self)
+
+    @discord.ui.button(label="次へ", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next_button(self, interaction: discord.Interaction, button: Button):
+        self.page_starts.append(self.last_id)
+        await interaction.response.edit_message(content=await self.render(), view=self)
+
+
+async def build_export_files(guild, fmt):
+    # 名前の解決はイベントループ上で辞書にしてから、書き出し処理 (別スレッド) に渡す
+    names = {m.id: m.name for m in guild.members}
+    parts = await export_members(users_repo.collection, guild.id, names, fmt)
+    files = [discord.File(fp, filename) for fp, filename in parts]
+    # 1メッセージに添付できるのは10ファイルまで
+    return [files[i:i + 10] for i in range(0, len(files), 10)]
+
+
+async def dashboard_admin_name(guild, cfg):
+    # 管理者名は一度だけ解決して覚えておく (まずゲートウェイのキャッシュ、無ければ REST で1回だけ)
+    admin_id = cfg.admin_id or guild.owner_id
+    if not admin_id: return "未設定"
+    if admin_id not in dashboard_admins:
+        admin_user = bot.get_user(admin_id)
+        if admin_user is None:
+            try:
+                admin_user = await bot.fetch_user(admin_id)
+            except discord.HTTPException:
+                return "未設定"
+        dashboard_admins[admin_id] = admin_user.name
+    return dashboard_admins[admin_id]
+
+
 async def update_dashboard(interaction_or_ctx, ctx_origin):
-    admin_user = await bot.fetch_user(current_admin_id) if current_admin_id else None
-    admin_name = admin_user.name if admin_user else "未設定"
-    member_count = users_col.count_documents({}) if users_col else 0
-    mode_info = THRESHOLDS[current_mode]
+    # 更新ボタンやモード変更のたびに Discord REST や DB 全件カウントを呼ばないよう、手元の状態だけで描画する
+    guild = ctx_origin.guild
+    cfg = await guild_configs.get(guild.id)
+    admin_name = await dashboard_admin_name(guild, cfg)
+    try:
+        member_count = await users_repo.cached_count(guild.id) if users_repo.available else 0
+    except Exception as e:
+        print(f"⚠️ メンバー数取得スキップ: {e}")
+        member_count = 0
+    mode_info = cfg.thresholds
     embed = discord.Embed(title="🎛️ 管理ダッシュボード", color=discord.Color.dark_theme())
     embed.add_field(name="🏠 サーバー", value=f"{ctx_origin.guild.name}", inline=True)
     embed.add_field(name="👤 管理者", value=f"{admin_name}", inline=True)
@@ -376,68 +750,266 @@ async def update_dashboard(interaction_or_ctx, ctx_origin):
         await interaction_or_ctx.response.edit_message(embed=embed, view=view)
 
 
+def is_exempt_member(member, guild):
+    if member is None: return False
+    role_advisor = discord.utils.get(guild.roles, name=ROLE_ADVISOR)
+    role_grace = discord.utils.get(guild.roles, name=ROLE_GRACE)
+    if role_advisor and role_advisor in member.roles: return True
+    if role_grace and role_grace in member.roles: return True
+    return False
+
+
+async def check_levels(users, max_level):
+    # Riot API でレベルを確認し、(DB更新操作, [(ユーザー, 新レベル), ...] 卒業対象) を返す (ワーカーからも呼ぶ)
+    semaphore = asyncio.Semaphore(AUDIT_CONCURRENCY)
+    now = datetime.datetime.now()
+
+    # 404 (削除されたアカウント) や 400 (puuid の誤り) は何度確認しても同じなので、ローリング監査の先頭に
+    # 居座らないよう更新日時だけ進める。Riot 側の障害・遮断中・429 の時は次の機会にもう一度確認する
+    skip = lambda u: (UpdateOne({"_id": u['_id']}, {"$set": {"last_updated": now}}), None)
+
+    async def check_level(u):
+        if not u.get('puuid'): return skip(u)
+        async with semaphore:
+            try:
+                summ = await call_riot_api(riot_client.summoner_by_puuid, REGION_PLATFORM, u['puuid'])
+            except RiotApiError as e:
+                if e.status_code in (400, 404): return skip(u)
+                return None, None
+            except Exception:
+                return None, None
+        new_level = summ['summonerLevel']
+        op = UpdateOne({"_id": u['_id']}, {"$set": {"level": new_level, "last_updated": now}})
+        return op, (u, new_level) if new_level >= max_level else None
+
+    ops, graduates = [], []
+    # 監査はバックグラウンド扱い: /link など人が待っているリクエストに枠を譲る
+    with priority(PRIORITY_BACKGROUND):
+        results = await asyncio.gather(*(check_level(u) for u in users))
+    for op, grad in results:
+        if op: ops.append(op)
+        if grad: graduates.append(grad)
+    return ops, graduates
+
+
+async def audit_user_levels(guild, cfg, users):
+    # 免除対象の判定 (ロールを見る) だけここで行い、残りのレベル確認はワーカーか、このプロセスで行う。
+    # ワーカーに任せた分の DB 更新はワーカーが済ませるので、返す操作には含まれない
+    now = datetime.datetime.now()
+    ops, targets = [], []
+    for u in users:
+        # 免除対象は確認しないが、ローリング監査で先頭に居座らないよう更新日時だけ進める
+        if is_exempt_member(guild.get_member(u['discord_id']), guild):
+            ops.append(UpdateOne({"_id": u['_id']}, {"$set": {"last_updated": now}}))
+        else:
+            targets.append(u)
+    if not targets: return ops, []
+    if not use_job_queue():
+        level_ops, graduates = await check_levels(targets, cfg.max_level)
+        return ops + level_ops, graduates
+
+    by_id = {u['_id']: u for u in targets}
+    job_ids = []
+    for i in range(0, len(targets), AUDIT_JOB_SIZE):
+        chunk = [{k: u.get(k) for k in ("_id", "discord_id", "puuid", "level")} for u in targets[i:i + AUDIT_JOB_SIZE]]
+        job_ids.append(await job_queue.enqueue("audit", {"users": chunk, "max_level": cfg.max_level}))
+    finished = await job_queue.wait(job_ids, AUDIT_JOB_TIMEOUT)
+    if len(finished) < len(job_ids):
+        # 終わらなかった分は次のローリング監査で確認される
+        print(f"⚠️ 監査ジョブ {len(job_ids) - len(finished)} 件が時間内に終わりませんでした")
+    # ワーカーがレベルを書き換えたのでランキングのキャッシュを捨てる
+    users_repo.external_write(guild.id)
+    graduates = [(by_id[g["_id"]], g["level"]) for job in finished.values() if job["status"] == "done"
+                 for g in job["result"]["graduates"]]
+    return ops, graduates
+
+
+def audit_lock_for(guild_id):
+    if guild_id not in audit_locks: audit_locks[guild_id] = asyncio.Lock()
+    return audit_locks[guild_id]
+
+
 async def run_audit_logic(ctx):
-    if not users_col: return await ctx.send("❌ データベース未接続")
-    status_msg = await ctx.send("🔍 監査中... 0%")
-    users = list(users_col.find())
-    total = len(users)
-    graduates = []
-    role_advisor = discord.utils.get(ctx.guild.roles, name=ROLE_ADVISOR)
-    role_grace = discord.utils.get(ctx.guild.roles, name=ROLE_GRACE)
-    for i, u in enumerate(users):
-        member = ctx.guild.get_member(u['discord_id'])
-        if member:
-            if role_advisor and role_advisor in member.roles: continue
-            if role_grace and role_grace in member.roles: continue
-        await asyncio.sleep(3.0)
+    # ctx は commands.Context でも TextChannel でもよい (再起動後の自動再開ではチャンネルを渡す)
+    if not users_repo.available: return await ctx.send("❌ データベース未接続")
+    guild = ctx.guild
+    audit_lock = audit_lock_for(guild.id)
+    if audit_lock.locked(): return await ctx.send("⚠️ 監査は既に実行中です")
+    async with audit_lock:
+        with trace("audit", guild=guild.id):
+            cfg = await guild_configs.get(guild.id)
+            checkpoint_id = f"audit:{guild.id}"
+            checkpoint = await run_db(audit_col.find_one, {"_id": checkpoint_id})
+            resumed = checkpoint is not None
+            if not resumed:
+                checkpoint = {"_id": checkpoint_id,
+                              "channel_id": ctx.channel.id if isinstance(ctx, commands.Context) else ctx.id,
+                              "last_id": None, "done": 0, "graduates": []}
+            total = await users_repo.count(guild.id)
+            head = "🔍 前回の続きから監査を再開します..." if resumed else "🔍 監査中..."
+            status_msg = await ctx.send(f"{head} 0%")
+            last_edit = time.monotonic()
+
+            while True:
+                with span("audit.fetch_batch"):
+                    batch = await users_repo.find_after(guild.id, checkpoint["last_id"], AUDIT_BATCH_SIZE,
+                                                        {"discord_id": 1, "puuid": 1})
+                if not batch: break
+
+                with span("audit.levels"):
+                    ops, graduates = await audit_user_levels(guild, cfg, batch)
+                for u, new_level in graduates:
+                    checkpoint["graduates"].append(f"<@{u['discord_id']}> (Lv.{new_level})")
+                if ops:
+                    with span("audit.bulk_write"):
+                        await users_repo.bulk_write(ops)
+
+                # バッチごとに進捗を保存し、落ちてもここから再開できるようにする
+                checkpoint["last_id"] = batch[-1]['_id']
+                checkpoint["done"] += len(batch)
+                with span("audit.checkpoint"):
+                    await run_db(audit_col.replace_one, {"_id": checkpoint_id}, checkpoint, upsert=True)
+
+                if time.monotonic() - last_edit >= AUDIT_PROGRESS_INTERVAL:
+                    last_edit = time.monotonic()
+                    with span("discord.progress_edit"):
+                        await status_msg.edit(content=f"{head} {int((checkpoint['done'] / max(total, 1)) * 100)}%")
+
+            await run_db(audit_col.delete_one, {"_id": checkpoint_id})
+            await status_msg.edit(content="✅ 監査完了")
+            graduates = checkpoint["graduates"]
+            if graduates: await ctx.send(f"⚠️ **卒業対象:**\n" + "\n".join(graduates))
+
+
+async def resume_interrupted_audit():
+    # 再起動や DB 切断で中断された監査があれば続きから再開する
+    if audit_col is None or not bot.is_ready(): return
+    try:
+        checkpoints = await run_db(lambda: [*audit_col.find({"_id": {"$regex": "^audit:"}})])
+        for checkpoint in checkpoints:
+            channel = bot.get_channel(checkpoint["channel_id"])
+            if channel and not audit_lock_for(channel.guild.id).locked():
+                asyncio.create_task(run_audit_logic(channel))
+    except Exception as e:
+        print(f"⚠️ 監査の再開に失敗: {e}")
+
+
+async def rolling_audit_tick():
+    if not users_repo.available or any(lock.locked() for lock in audit_locks.values()): return
+
+    # 次の周期までに使える残り枠から、今回確認する人数を決める
+    budget = limiter.budget(REGION_PLATFORM, METHOD_SUMMONER, ROLLING_AUDIT_INTERVAL)
+    n = min(ROLLING_AUDIT_MAX_BATCH, int(budget * ROLLING_AUDIT_BUDGET_SHARE))
+    if n <= 0: return
+
+    # 全サーバーの登録者から古い順に選び、サーバーごとの設定で判定する
+    projection = {"guild_id": 1, "discord_id": 1, "puuid": 1, "level": 1}
+    users = await users_repo.find(None, projection, sort=[("last_updated", 1)], limit=n)
+    by_guild = {}
+    for u in users: by_guild.setdefault(u.get('guild_id'), []).append(u)
+
+    for guild_id, group in by_guild.items():
+        guild = bot.get_guild(guild_id) if guild_id is not None else None
+        if guild is None:
+            # Bot が居ないサーバーの登録は確認できないので、先頭に居座らないよう更新日時だけ進める
+            now = datetime.datetime.now()
+            await users_repo.bulk_write([UpdateOne({"_id": u['_id']}, {"$set": {"last_updated": now}}) for u in group])
+            continue
+        cfg = await guild_configs.get(guild_id)
+        ops, graduates = await audit_user_levels(guild, cfg, group)
+        if ops: await users_repo.bulk_write(ops)
+
+        # 今回初めて上限を超えた人だけ通知する
+        new_graduates = [(u, lv) for u, lv in graduates if u.get('level', 0) < cfg.max_level]
+        channel = log_channel_for(guild, cfg)
+        if new_graduates and channel:
+            lines = [f"<@{u['discord_id']}> (Lv.{lv}) `/graduate {u['discord_id']}`" for u, lv in new_graduates]
+            await channel.send(f"🎓 **卒業対象を検出しました:**\n" + "\n".join(lines))
+
+
+async def rolling_audit_loop():
+    await bot.wait_until_ready()
+    while not bot.is_closed():
         try:
-            summ = call_riot_api(lol_watcher.summoner.by_puuid, REGION_PLATFORM, u['puuid'])
-            new_level = summ['summonerLevel']
-            # timeoutオプションを削除
-            users_col.update_one({"_id": u['_id']}, {"$set": {"level": new_level}})
-            if new_level >= MAX_LEVEL:
-                graduates.append(f"<@{u['discord_id']}> (Lv.{new_level})")
-        except:
-            pass
-        if i % 5 == 0: await status_msg.edit(content=f"🔍 監査中... {int((i / total) * 100)}%")
-    await status_msg.edit(content="✅ 監査完了")
-    if graduates: await ctx.send(f"⚠️ **卒業対象:**\n" + "\n".join(graduates))
+            with trace("rolling_audit"):
+                await rolling_audit_tick()
+        except Exception as e:
+            print(f"⚠️ ローリング監査エラー: {e}")
+        await asyncio.sleep(ROLLING_AUDIT_INTERVAL)
+
+
+async def loop_lag_monitor():
+    # 1秒 sleep したつもりが何秒遅れて戻ってきたか = イベントループの詰まり具合
+    while not bot.is_closed():
+        start = time.perf_counter()
+        await asyncio.sleep(1.0)
+        LOOP_LAG.set(max(time.perf_counter() - start - 1.0, 0.0))
+
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+    # コマンド全体を1本のトレースにする (/perf profile で指定された分は cProfile も取る)
+    guild_id = ctx.guild.id if ctx.guild else None
+    ctx.trace, ctx.trace_token = start_trace(f"/{ctx.command.qualified_name}", guild=guild_id, user=ctx.author.id)
+    profiler.maybe_start(ctx.trace)
+
+
+@bot.after_invoke
+async def record_command_latency(ctx):
+    if not hasattr(ctx, "started_at"): return
+    status = "error" if ctx.command_failed else "ok"
+    COMMAND_LATENCY.observe(time.perf_counter() - ctx.started_at, command=ctx.command.qualified_name, status=status)
+    profiler.stop(ctx.trace)
+    finish_trace(ctx.trace, ctx.trace_token, status)
 
 
 @bot.event
 async def on_ready():
-    print(f'Bot is ready: {bot.user.name}')
-    if LOG_CHANNEL_ID:
+    print(f'Bot is ready: {bot.user.name} ({len(bot.guilds)} サーバー / {bot.shard_count} シャード)')
+    for guild in bot.guilds:
         try:
-            channel = bot.get_channel(LOG_CHANNEL_ID)
+            channel = log_channel_for(guild, await guild_configs.get(guild.id))
             if channel: await channel.send("✅ **BOTが起動しました** (Riot障害対策済み)")
         except:
             pass
 
+    # 常時ローリング監査 (on_ready は再接続でも呼ばれるので一度だけ起動する)
+    global mongo_task, rolling_audit_task, loop_lag_task
+    if MONGO_URL and (mongo_task is None or mongo_task.done()):
+        mongo_task = asyncio.create_task(mongo_keeper())
+    if rolling_audit_task is None or rolling_audit_task.done():
+        rolling_audit_task = asyncio.create_task(rolling_audit_loop())
+    if loop_lag_task is None or loop_lag_task.done():
+        loop_lag_task = asyncio.create_task(loop_lag_monitor())
+    await resume_interrupted_audit()
+
 
 @bot.command()
 async def dashboard(ctx):
-    if not is_admin_or_owner(ctx): return
+    if not await is_admin_or_owner(ctx): return
     await update_dashboard(ctx, ctx)
 
 
 @bot.command()
 async def standards(ctx):
-    mode = THRESHOLDS[current_mode]
+    cfg = await guild_configs.get(ctx.guild.id)
+    mode = cfg.thresholds
     embed = discord.Embed(title=f"📏 現在の基準: {mode['name']}", color=discord.Color.blue())
     embed.add_field(name="勝率", value=f"**{mode['win_rate']}%** 以上で警告", inline=True)
     embed.add_field(name="KDA", value=f"**{mode['kda']}** 以上で警告", inline=True)
     embed.add_field(name="CS/分", value=f"**{mode['cspm']}** 以上で警告", inline=True)
     embed.add_field(name="Gold/分", value=f"**{mode['gpm']}** 以上で警告", inline=True)
     embed.add_field(name="DMGシェア", value=f"**{mode['dmg']}%** 以上で警告", inline=True)
-    embed.add_field(name="レベル上限", value=f"**Lv.{MAX_LEVEL}** (これ以上は卒業)", inline=False)
+    embed.add_field(name="レベル上限", value=f"**Lv.{cfg.max_level}** (これ以上は卒業)", inline=False)
     await ctx.send(embed=embed)
 
 
 @bot.command()
 async def link(ctx, *, riot_id_str):
     if '#' not in riot_id_str: return await ctx.send("❌ `名前#タグ` の形式で入力してください (例: Name#JP1)")
-    if current_guild_id != 0 and ctx.guild.id != current_guild_id: return await ctx.send("⚠️ 対象外サーバー")
+    if ctx.guild is None: return await ctx.send("⚠️ サーバー内で実行してください")
+    cfg = await guild_configs.get(ctx.guild.id)
 
     riot_id_str = riot_id_str.replace("　", " ")
 
@@ -450,18 +1022,19 @@ async def link(ctx, *, riot_id_str):
     name, tag = riot_id_str.rsplit('#', 1)
     note = "(免除対象)" if is_exempt else ""
     await ctx.send(f"📊 `{name}#{tag}` を分析中... {note}")
-    result = await analyze_player_stats(name, tag, ctx.author.id, is_exempt=is_exempt)
+    result = await request_link_analysis(name, tag, ctx.author.id, is_exempt, cfg)
     status = result['status']
     if status == "ERROR": return await ctx.send(f"{result['reason']}")
     member = ctx.author
     if status == "GRADUATE":
         await ctx.send("🎓 レベル上限超過のため卒業対象です。")
         try:
-            admin = await bot.fetch_user(current_admin_id)
-            if admin:
-                d = result['data']
-                await admin.send(
-                    f"**【🎓 卒業推奨】**\n対象: {member.mention}\nID: `{d['riot_id']}`\nLv: **{d['level_raw']}**\n`/graduate {member.id}`")
+            with span("discord.admin_dm"):
+                admin = await bot.fetch_user(cfg.admin_id or ctx.guild.owner_id)
+                if admin:
+                    d = result['data']
+                    await admin.send(
+                        f"**【🎓 卒業推奨】**\n対象: {member.mention}\nID: `{d['riot_id']}`\nLv: **{d['level_raw']}**\n`/graduate {member.id}`")
         except:
             pass
         return
@@ -471,18 +1044,20 @@ async def link(ctx, *, riot_id_str):
     await ctx.send("📋 集計完了。承認をお待ちください。")
 
     # DM送信（デバッグログ付き）
-    print(f"🔍 [DEBUG] 管理者ID(環境変数): {current_admin_id}")
+    admin_id = cfg.admin_id or ctx.guild.owner_id
+    print(f"🔍 [DEBUG] 管理者ID(サーバー {ctx.guild.id}): {admin_id}")
     try:
-        if current_admin_id == 0:
+        if admin_id == 0:
             print("❌ [ERROR] 管理者ID未設定")
             return
 
-        admin = await bot.fetch_user(current_admin_id)
+        with span("discord.admin_dm"):
+            admin = await bot.fetch_user(admin_id)
 
         d = result['data']
         # Riotエラー時はデータが存在しない可能性があるので .get() を使う
         opgg = f"https://www.op.gg/summoners/jp/{name.replace(' ', '%20')}-{tag}"
-        mode_name = THRESHOLDS[current_mode]['name']
+        mode_name = cfg.thresholds['name']
 
         msg = (f"**【新規申請 / {mode_name}】**\n"
                f"対象: {member.mention}\n"
@@ -492,7 +1067,8 @@ async def link(ctx, *, riot_id_str):
                f"警告: {d.get('troll', '不明')} [OP.GG]({opgg})\n"
                f"`/approve {member.id}` / `/reject {member.id}`")
 
-        await admin.send(msg)
+        with span("discord.admin_dm"):
+            await admin.send(msg)
         print("📨 [SUCCESS] DM送信に成功しました！")
 
     except Exception as e:
@@ -502,7 +1078,7 @@ async def link(ctx, *, riot_id_str):
 
 @bot.command()
 async def approve(ctx, user_id: int):
-    if ctx.author.id != current_admin_id: return
+    if not await is_guild_admin(ctx): return
     member = ctx.guild.get_member(user_id)
     if member:
         role_mem = discord.utils.get(ctx.guild.roles, name=ROLE_MEMBER)
@@ -514,7 +1090,7 @@ async def approve(ctx, user_id: int):
 
 @bot.command()
 async def reject(ctx, user_id: int):
-    if ctx.author.id != current_admin_id: return
+    if not await is_guild_admin(ctx): return
     member = ctx.guild.get_member(user_id)
     if member:
         await ctx.guild.kick(member, reason="審査拒否")
@@ -523,21 +1099,21 @@ async def reject(ctx, user_id: int):
 
 @bot.command()
 async def graduate(ctx, user_id: int):
-    if ctx.author.id != current_admin_id: return
+    if not await is_guild_admin(ctx): return
     member = ctx.guild.get_member(user_id)
     if member:
         try:
-            await member.send(f"🌸 レベル上限({MAX_LEVEL})により卒業となります。")
+            await member.send(f"🌸 レベル上限({(await guild_configs.get(ctx.guild.id)).max_level})により卒業となります。")
         except:
             pass
         await ctx.guild.kick(member, reason="レベル卒業")
-        if users_col: users_col.delete_one({"discord_id": user_id})
+        if users_repo.available: await users_repo.delete(ctx.guild.id, user_id)
         await ctx.send(f"🎓 {member.display_name} を卒業させました。")
 
 
 @bot.command()
 async def graduate_rank(ctx, user_id: int):
-    if ctx.author.id != current_admin_id: return
+    if not await is_guild_admin(ctx): return
     member = ctx.guild.get_member(user_id)
     if member:
         try:
@@ -545,85 +1121,322 @@ async def graduate_rank(ctx, user_id: int):
         except:
             pass
         await ctx.guild.kick(member, reason="ランク昇格")
-        if users_col: users_col.delete_one({"discord_id": user_id})
+        if users_repo.available: await users_repo.delete(ctx.guild.id, user_id)
         await ctx.send(f"🎉 {member.display_name} を卒業させました。")
 
 
 @bot.command()
 async def shutdown(ctx):
-    if not is_admin_or_owner(ctx): return
+    # 全サーバーに影響するので Bot の運用者 (ADMIN_USER_ID) だけが実行できる
+    if not ADMIN_USER_ID or ctx.author.id != ADMIN_USER_ID: return
     await ctx.send("システムをシャットダウンします...")
+    await riot_client.close()
     await bot.close()
 
 
+@bot.command()
+async def perf(ctx, action: str = "", n: int = 5):
+    # 区間ごとの p50/p95/最大と、遅かったトレース。全サーバー分の記録なので運用者 (ADMIN_USER_ID) だけ
+    # /perf profile N : 次の N 件のコマンドで cProfile を取る (0 で中止) / /perf profiles : 取得結果をファイルで受け取る
+    if not ADMIN_USER_ID or ctx.author.id != ADMIN_USER_ID: return
+    if action == "profile":
+        profiler.arm(n)
+        if n <= 0: return await ctx.send("🧪 cProfile の取得を止めました")
+        return await ctx.send(f"🧪 次の {n} 件のコマンドで cProfile を取ります (`/perf profiles` で受け取り)")
+    if action == "profiles":
+        if not profiles: return await ctx.send("⚠️ 取得済みのプロファイルはありません")
+        text = "\n\n".join(f"===== {started:%Y-%m-%d %H:%M:%S} {name} ({elapsed:.2f}s) =====\n{body}"
+                           for started, name, elapsed, body in profiles)
+        return await ctx.send(file=discord.File(io.BytesIO(text.encode("utf-8")), filename="perf_profiles.txt"))
+
+    rows = [f"{'区間':<22}{'回数':>5}{'p50':>8}{'p95':>8}{'max':>8}"]
+    for name, count, p50, p95, worst in phase_stats():
+        rows.append(f"{name[:24]:<24}{count:>5}{p50 * 1000:>8.0f}{p95 * 1000:>8.0f}{worst * 1000:>8.0f}")
+    embed = discord.Embed(title="⏱️ 処理時間 (ms)", color=discord.Color.dark_teal(),
+                          description="```\n" + clip_lines(rows, 3900) + "\n```" if len(rows) > 1 else "まだ記録がありません")
+    for t in slowest(min(max(n, 1), 10)):
+        lines = [f"`{name}` ×{count} 合計 {total:.2f}s / 最大 {worst:.2f}s" for name, (count, total, worst) in
+                 t.breakdown()[:5]]
+        attrs = " ".join(f"{k}={v}" for k, v in t.attrs.items() if v is not None)
+        embed.add_field(name=f"🐢 {t.name} {t.total:.2f}s ({t.started_at:%m/%d %H:%M:%S}, {t.status})",
+                        value=clip_lines([attrs] + lines if attrs else lines, 1000), inline=False)
+    if profiler.remaining: embed.set_footer(text=f"cProfile: 残り {profiler.remaining} 件 (間引き {profiler.skipped} 件)")
+    await ctx.send(embed=embed)
+
+
 @bot.command()
 async def list(ctx):
-    if not users_col: return await ctx.send("❌ データベース未接続")
-    users = users_col.find()
-    msg = "**📋 メンバー一覧**\n"
-    for u in users:
-        url = f"https://www.op.gg/summoners/jp/{u['riot_name'].replace(' ', '%20')}-{u['riot_tag']}"
-        d_user = ctx.guild.get_member(u['discord_id'])
-        d_name = d_user.display_name if d_user else "退室済み"
-        msg += f"• **{d_name}**: [{u['riot_name']}#{u['riot_tag']}]({url}) (Lv.{u['level']})\n"
-    if len(msg) > 1900: msg = msg[:1900] + "..."
-    await ctx.send(msg)
+    if not users_repo.available: return await ctx.send("❌ データベース未接続")
+    view = MemberListView(ctx)
+    await ctx.send(await view.render(), view=view)
 
 
 @bot.command()
-async def leaderboard(ctx, category: str = "level"):
-    if not users_col: return await ctx.send("❌ データベース未接続")
+async def leaderboard(ctx, category: str = "level", period: str = None):
+    if not users_repo.available: return await ctx.send("❌ データベース未接続")
     settings = {"level": "レベル", "win": "勝率", "kda": "KDA"}
+    fields = {"level": "level", "win": "win_rate", "kda": "kda"}
     cat = category.lower()
     if cat not in settings: return await ctx.send("❌ `/leaderboard level` `/leaderboard win` `/leaderboard kda`")
-    raw = list(users_col.find())
+    field = fields[cat]
+    title = f"🏆 {settings[cat]}ランキング"
+    if period:
+        # 期間を付けると、その期間での伸び (最新 - 期間内で最初の値) で並べる
+        period = period.lower()
+        if cat == "level" or period not in TREND_WINDOWS:
+            return await ctx.send("❌ `/leaderboard win 7d` `/leaderboard kda 30d` (期間は 7d / 30d)")
+        field = f"trend.{period}.{field}.delta"
+        title = f"📈 {settings[cat]}の伸びランキング (直近{TREND_WINDOWS[period]}日)"
+
+    # 事前計算済みの上位 N 件から退室者を除き、足りなければその先を追加で取りに行く
+    rows = await users_repo.leaderboard.get(ctx.guild.id, field)
+    skip = len(rows)
     data = []
-    for u in raw:
-        mem = ctx.guild.get_member(u['discord_id'])
-        if mem:
-            val = u.get("win_rate" if cat == "win" else "kda" if cat == "kda" else "level", 0)
-            data.append({"name": u['riot_name'], "val": val})
-    data.sort(key=lambda x: x["val"], reverse=True)
+    while True:
+        for u in rows:
+            if ctx.guild.get_member(u['discord_id']):
+                val = u
+                for part in field.split("."): val = val.get(part) if isinstance(val, dict) else None
+                data.append({"name": u['riot_name'], "val": val or 0})
+                if len(data) >= 10: break
+        if len(data) >= 10 or len(rows) < LEADERBOARD_CACHE_SIZE: break
+        rows = await users_repo.top(ctx.guild.id, field, LEADERBOARD_CACHE_SIZE, skip=skip)
+        skip += len(rows)
     text = ""
-    for i, d in enumerate(data[:10]): text += f"{i + 1}. **{d['name']}** - {round(d['val'], 1)}\n"
-    await ctx.send(embed=discord.Embed(title=f"🏆 {settings[cat]}ランキング", description=text or "データなし",
+    for i, d in enumerate(data[:10]):
+        val = f"{d['val']:+.1f}" if period else f"{round(d['val'], 1)}"
+        text += f"{i + 1}. **{d['name']}** - {val}\n"
+    await ctx.send(embed=discord.Embed(title=title, description=text or "データなし",
                                        color=discord.Color.gold()))
 
 
+async def import_rows(guild, cfg, rows, on_progress):
+    # 一括登録の本体。IMPORT_BATCH_SIZE 人ずつ並行して分析し、その分をまとめて1回で保存する。
+    # 試合詳細は match_cache と match_flight で共有されるので、同じ試合に出た人が多いほど速い
+    # ワーカーがいれば1人ずつジョブにして任せる (保存もワーカーが行うので、結果に profile は含まれない)
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+    entries = []
+    not_in_guild = {"status": "ERROR", "reason": "❌ サーバーにいないユーザーです"}
+
+    async def analyze_row(row, member):
+        if member is None: return not_in_guild
+        async with semaphore:
+            return await analyze_player_stats(row["name"], row["tag"], is_exempt=is_exempt_member(member, guild),
+                                              cfg=cfg)
+
+    async def analyze_in_workers(batch, members):
+        job_ids = {}
+        for idx, (row, member) in enumerate(zip(batch, members)):
+            if member is None: continue
+            payload = link_job_payload(row["name"], row["tag"], row["discord_id"], is_exempt_member(member, guild),
+                                       cfg)
+            job_ids[await job_queue.enqueue("import", payload)] = idx
+        finished = await job_queue.wait([*job_ids], IMPORT_JOB_TIMEOUT)
+        done = {idx: finished[job_id]["result"] for job_id, idx in job_ids.items()
+                if job_id in finished and finished[job_id]["status"] == "done"}
+        users_repo.external_write(guild.id, sum(int(r.get("upserted", False)) for r in done.values()))
+        timeout = {"status": "ERROR", "reason": "❌ 分析が時間内に終わりませんでした。もう一度お試しください。"}
+        return [not_in_guild if m is None else done.get(idx, timeout) for idx, m in enumerate(members)]
+
+    async def analyze_batch(batch):
+        members = [guild.get_member(row["discord_id"]) for row in batch]
+        if use_job_queue():
+            try:
+                return await analyze_in_workers(batch, members)
+            except Exception as e:
+                print(f"⚠️ ジョブ登録失敗、この場で分析します: {e}")
+        # 一括登録はバックグラウンド扱い: 同時に来た /link を先に通す
+        with priority(PRIORITY_BACKGROUND):
+            return await asyncio.gather(*(analyze_row(row, m) for row, m in zip(batch, members)))
+
+    for i in range(0, len(rows), IMPORT_BATCH_SIZE):
+        batch = rows[i:i + IMPORT_BATCH_SIZE]
+        results = await analyze_batch(batch)
+
+        saves = []
+        for row, result in zip(batch, results):
+            if result.get("profile"): saves.append((row["discord_id"], build_user_update(**result["profile"])))
+            entries.append((row["line"], row["discord_id"], f"{row['name']}#{row['tag']}", classify(result),
+                            row_reason(result)))
+        try:
+            await users_repo.bulk_upsert(guild.id, saves)
+        except Exception as e:
+            print(f"⚠️ 一括保存失敗: {e}")
+            saved = {discord_id for discord_id, _ in saves}
+            entries = [(*x[:3], BUCKET_ERROR, "❌ DB保存に失敗しました") if x[1] in saved else x for x in entries]
+        await on_progress(min(i + IMPORT_BATCH_SIZE, len(rows)))
+    return entries
+
+
+@bot.command(name="import")
+async def import_members(ctx):
+    # CSV (1行に discord_id と Riot ID) を添付して、まとめて分析・登録する
+    if not await is_admin_or_owner(ctx): return
+    if not users_repo.available: return await ctx.send("❌ データベース未接続")
+    if not ctx.message.attachments:
+        return await ctx.send("❌ CSV ファイルを添付してください (1行に `discord_id,名前#タグ`)")
+    try:
+        text = (await ctx.message.attachments[0].read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return await ctx.send("❌ CSV は UTF-8 で保存してください")
+    rows, parse_errors = parse_import_csv(text)
+    if not rows and not parse_errors: return await ctx.send("❌ 登録する行がありません")
+
+    cfg = await guild_configs.get(ctx.guild.id)
+    status_msg = await ctx.send(f"📥 {len(rows)} 人を一括登録中... 0%")
+    last_edit = time.monotonic()
+
+    async def on_progress(done):
+        nonlocal last_edit
+        if time.monotonic() - last_edit < AUDIT_PROGRESS_INTERVAL: return
+        last_edit = time.monotonic()
+        await status_msg.edit(content=f"📥 {len(rows)} 人を一括登録中... {int(done / max(len(rows), 1) * 100)}%")
+
+    started = time.monotonic()
+    entries = [(line, "", raw, BUCKET_ERROR, reason) for line, raw, reason in parse_errors]
+    entries += await import_rows(ctx.guild, cfg, rows, on_progress)
+    entries.sort(key=lambda e: e[0])
+    await status_msg.edit(content=f"✅ 一括登録完了 ({time.monotonic() - started:.0f}秒)")
+
+    buckets = {b: [e for e in entries if e[3] == b] for b in BUCKET_LABELS}
+    embed = discord.Embed(title=f"📥 一括登録レポート ({cfg.thresholds['name']})", color=discord.Color.blue(),
+                          description=" / ".join(f"{BUCKET_LABELS[b]}: **{len(v)}**" for b, v in buckets.items()))
+    for b in (BUCKET_APPROVE, BUCKET_GRADUATE, BUCKET_REVIEW):
+        if not buckets[b]: continue
+        lines = [f"<@{e[1]}> `{e[2]}`" for e in buckets[b][:15]]
+        if len(buckets[b]) > 15: lines.append(f"…ほか {len(buckets[b]) - 15} 人")
+        embed.add_field(name=BUCKET_LABELS[b], value="\n".join(lines)[:1024], inline=False)
+    if buckets[BUCKET_ERROR]:
+        lines = [f"{e[0]}行目 `{e[2]}`: {e[4]}" for e in buckets[BUCKET_ERROR][:10]]
+        if len(buckets[BUCKET_ERROR]) > 10: lines.append(f"…ほか {len(buckets[BUCKET_ERROR]) - 10} 件")
+        embed.add_field(name=BUCKET_LABELS[BUCKET_ERROR], value="\n".join(lines)[:1024], inline=False)
+    embed.set_footer(text="全行の結果は添付の CSV を確認してください。承認は /approve、卒業は /graduate で行います。")
+    report = discord.File(io.BytesIO(build_report_csv(entries)), filename="import_report.csv")
+    await ctx.send(embed=embed, file=report)
+
+
+@bot.command()
+async def export(ctx, fmt: str = "xlsx"):
+    if not await is_admin_or_owner(ctx): return
+    if not users_repo.available: return await ctx.send("❌ データベース未接続")
+    fmt = fmt.lower()
+    if fmt not in EXPORT_FORMATS: return await ctx.send("❌ `/export xlsx` `/export csv` `/export csv.gz`")
+    if fmt == "xlsx" and Workbook is None: return await ctx.send("❌ openpyxl が未インストールです")
+    await ctx.send("📥 名簿を出力中...")
+    for files in await build_export_files(ctx.guild, fmt):
+        await ctx.send("📊 出力完了", files=files)
+
+
 @bot.command()
 async def manual(ctx):
     embed = discord.Embed(title="📜 Botコマンド一覧", color=discord.Color.blue())
     embed.add_field(name="🔰 一般用",
-                    value="`/link [名前#タグ]` : アカウント連携\n`/list` : メンバー一覧\n`/standards` : 基準値の確認\n`/leaderboard [項目]` : ランキング",
+                    value="`/link [名前#タグ]` : アカウント連携\n`/list` : メンバー一覧\n`/standards` : 基準値の確認\n`/leaderboard [項目] [7d|30d]` : ランキング (期間指定で伸び順)",
                     inline=False)
-    if is_admin_or_owner(ctx):
-        embed.add_field(name="👑 管理者用", value="`/dashboard` : 管理パネル\n`/shutdown` : Bot停止", inline=False)
+    if await is_admin_or_owner(ctx):
+        embed.add_field(name="👑 管理者用",
+                        value="`/dashboard` : 管理パネル\n`/export [xlsx|csv|csv.gz]` : 名簿出力\n`/import` (CSV添付) : 一括登録\n`/shutdown` : Bot停止\n"
+                              "`/perf [profile N|profiles]` : 処理時間の確認 (運用者のみ)",
+                        inline=False)
+        embed.add_field(name="⚙️ サーバー設定",
+                        value="`/set_mode [モード]` : 分析モード\n`/set_threshold [項目] [値]` : 基準値の上書き\n"
+                              "`/rescore [モード] [項目=値 ...]` : 基準変更の影響を確認\n"
+                              "`/set_max_level [Lv]` : レベル上限\n`/set_admin [ユーザーID]` : 管理者\n"
+                              "`/set_log_channel [チャンネルID]` : 通知先",
+                        inline=False)
     await ctx.send(embed=embed)
 
 
 @bot.command()
 async def set_mode(ctx, mode: str):
-    if not is_admin_or_owner(ctx): return
-    global current_mode
+    if not await is_admin_or_owner(ctx): return
     mode = mode.upper()
     if mode in THRESHOLDS:
-        current_mode = mode
-        await ctx.send(f"✅ モード変更: {THRESHOLDS[mode]['name']}")
+        old = (await guild_configs.get(ctx.guild.id)).thresholds
+        cfg = await guild_configs.update(ctx.guild.id, mode=mode)
+        await ctx.send(f"✅ モード変更: {cfg.thresholds['name']}")
+        await report_rescore(ctx.send, ctx.guild, old, cfg.thresholds)
+
+
+@bot.command()
+async def set_threshold(ctx, key: str, value: float):
+    # 現在のモードの基準値をこのサーバーだけ上書きする
+    if not await is_admin_or_owner(ctx): return
+    if key not in THRESHOLD_KEYS: return await ctx.send(f"❌ 項目は {' / '.join(THRESHOLD_KEYS)} のいずれかです")
+    old = (await guild_configs.get(ctx.guild.id)).thresholds
+    cfg = await guild_configs.set_threshold(ctx.guild.id, key, value)
+    await ctx.send(f"✅ {cfg.thresholds['name']} の `{key}` を {value} に変更しました")
+    await report_rescore(ctx.send, ctx.guild, old, cfg.thresholds)
+
+
+@bot.command(name="rescore")
+async def rescore_preview(ctx, *args):
+    # 基準を変えたらどうなるかの確認だけ (設定は変えない)。例: /rescore ADVANCED kda=3.5 win_rate=55
+    if not await is_admin_or_owner(ctx): return
+    cfg = await guild_configs.get(ctx.guild.id)
+    mode, changes = cfg.mode, {}
+    for arg in args:
+        if arg.upper() in THRESHOLDS:
+            mode = arg.upper()
+            continue
+        key, _, value = arg.partition("=")
+        try:
+            if key not in THRESHOLD_KEYS: raise ValueError
+            changes[key] = float(value)
+        except ValueError:
+            return await ctx.send(f"❌ `{arg}` を読めません。`項目=値` (項目: {' / '.join(THRESHOLD_KEYS)}) かモード名で指定してください")
+    new = {**cfg.thresholds_for(mode), **changes}
+    if not await report_rescore(ctx.send, ctx.guild, cfg.thresholds, new):
+        await ctx.send("⚠️ DB未接続のため再採点できません")
+
+
+@bot.command()
+async def set_max_level(ctx, level: int):
+    if not await is_admin_or_owner(ctx): return
+    if level <= 0: return await ctx.send("❌ 1以上を指定してください")
+    await guild_configs.update(ctx.guild.id, max_level=level)
+    await ctx.send(f"✅ レベル上限を Lv.{level} に変更しました")
+
+
+@bot.command()
+async def set_admin(ctx, user_id: int):
+    # 管理者の変更はサーバーオーナー (または現在の管理者) だけ
+    if not await is_admin_or_owner(ctx): return
+    if ctx.guild.get_member(user_id) is None: return await ctx.send("❌ このサーバーのメンバーではありません")
+    await guild_configs.update(ctx.guild.id, admin_id=user_id)
+    await ctx.send(f"✅ 管理者を <@{user_id}> に変更しました")
+
+
+@bot.command()
+async def set_log_channel(ctx, channel_id: int):
+    if not await is_admin_or_owner(ctx): return
+    channel = ctx.guild.get_channel(channel_id)
+    if channel is None: return await ctx.send("❌ このサーバーのチャンネルではありません")
+    await guild_configs.update(ctx.guild.id, log_channel_id=channel_id)
+    await ctx.send(f"✅ 通知先を {channel.mention} に変更しました")
 
 
 # ==========================================
 # 起動処理 (エラー時待機機能付き)
 # ==========================================
-keep_alive()
-
-if DISCORD_TOKEN:
-    try:
-        bot.run(DISCORD_TOKEN)
-    except Exception as e:
-        err_str = str(e)
-        if "429" in err_str or "1015" in err_str or "<html" in err_str:
-            print("🚨 Discord APIにより一時的に遮断されています (Rate Limit)。")
-            print("⏳ 60分間待機してから終了します。")
-            time.sleep(3600)
-        else:
-            print(f"❌ 致命的なエラー: {e}")
\ No newline at end of file
+# 他のモジュール (ベンチマーク等) から import した時は起動しない
+if __name__ == "__main__":
+    # /healthz で確認する項目 (Flask のスレッドから呼ばれる)
+    # DB の生存確認は mongo_keeper が定期的に行っているので、その結果を返す。
+    # MONGO_URL 未設定 (最初から DB なしで動かす) なら確認項目に入れない
+    if MONGO_URL: health_checks["mongodb"] = lambda: users_repo.available
+    health_checks["riot"] = riot_client.healthy
+    health_checks["gateway"] = lambda: bot.is_ready() and not bot.is_closed()
+    keep_alive()
+
+    if DISCORD_TOKEN:
+        try:
+            bot.run(DISCORD_TOKEN)
+        except Exception as e:
+            err_str = str(e)
+            if "429" in err_str or "1015" in err_str or "<html" in err_str:
+                print("🚨 Discord APIにより一時的に遮断されています (Rate Limit)。")
+                print("⏳ 60分間待機してから終了します。")
+                time.sleep(3600)
+            else:
+                print(f"❌ 致命的なエラー: {e}")
\ No newline at end of file
@@ -0,0 +1,83 @@
+import csv
+import io
+
+# ==========================================
+# 名簿の一括登録 (CSV 読み込みと結果の仕分け)
+# ==========================================
+# 1行に discord_id と Riot ID を書いた CSV を読む。Riot ID は "名前#タグ" の1列でも、名前・タグの2列でもよい。
+# 見出し行があっても (1列目が数字でなければ) 読み飛ばす。
+IMPORT_MAX_ROWS = 1000
+REPORT_HEADER = ["行", "Discord ID", "Riot ID", "判定", "理由"]
+
+BUCKET_APPROVE = "approve"
+BUCKET_REVIEW = "review"
+BUCKET_GRADUATE = "graduate"
+BUCKET_ERROR = "error"
+BUCKET_LABELS = {BUCKET_APPROVE: "✅ 承認候補", BUCKET_REVIEW: "📋 要確認", BUCKET_GRADUATE: "🎓 卒業対象",
+                 BUCKET_ERROR: "❌ エラー"}
+
+
+def parse_import_csv(text):
+    # ([{"line", "discord_id", "name", "tag"}, ...], [(行番号, 元の内容, 理由), ...]) を返す
+    rows, errors, seen = [], [], set()
+    for line_no, cols in enumerate(csv.reader(io.StringIO(text)), start=1):
+        cols = [c.replace("　", " ").strip() for c in cols]
+        if not any(cols): continue
+        raw = ",".join(cols)
+        if not cols[0].isdigit():
+            if line_no == 1: continue
+            errors.append((line_no, raw, "Discord ID が数字ではありません"))
+            continue
+        if len(cols) >= 2 and "#" in cols[1]:
+            name, tag = cols[1].rsplit("#", 1)
+        elif len(cols) >= 3:
+            name, tag = cols[1], cols[2]
+        else:
+            name = tag = ""
+        if not name.strip() or not tag.strip():
+            errors.append((line_no, raw, "Riot ID は `名前#タグ` の形式で書いてください"))
+            continue
+        discord_id = int(cols[0])
+        if discord_id in seen:
+            errors.append((line_no, raw, "同じ Discord ID が複数行にあります"))
+            continue
+        if len(rows) >= IMPORT_MAX_ROWS:
+            errors.append((line_no, raw, f"上限 {IMPORT_MAX_ROWS} 行を超えたため、ここから先は読み込んでいません"))
+            break
+        seen.add(discord_id)
+        rows.append({"line": line_no, "discord_id": discord_id, "name": name.strip(), "tag": tag.strip()})
+    return rows, errors
+
+
+def classify(result):
+    # 分析結果を承認候補 / 要確認 / 卒業対象 / エラーに分ける (警告が1つも無い時だけ承認候補)
+    status = result["status"]
+    if status == "ERROR": return BUCKET_ERROR
+    if status == "GRADUATE": return BUCKET_GRADUATE
+    data = result.get("data") or {}
+    warned = any("⚠️" in str(v) for k, v in data.items() if k.startswith("fmt_"))
+    if result.get("reason") != "完了" or warned or data.get("troll") != "なし": return BUCKET_REVIEW
+    return BUCKET_APPROVE
+
+
+def row_reason(result):
+    # レポートに書く理由 (基準外の項目、またはエラー・卒業の理由)
+    data = result.get("data") or {}
+    if result["status"] != "REVIEW" or result.get("reason") != "完了": return result.get("reason") or ""
+    labels = {"fmt_level": "レベル", "fmt_win": "勝率", "fmt_kda": "KDA", "fmt_cspm": "CS/分", "fmt_gpm": "Gold/分",
+              "fmt_dmg": "DMGシェア"}
+    parts = []
+    warned = [label for k, label in labels.items() if "⚠️" in str(data.get(k, ""))]
+    if warned: parts.append("基準外: " + ", ".join(warned))
+    if data.get("troll") not in (None, "なし"): parts.append(f"警告: {data['troll']}")
+    return " / ".join(parts) or f"直近{data.get('matches', 0)}試合 問題なし"
+
+
+def build_report_csv(entries):
+    # entries: [(行, discord_id, Riot ID, 判定, 理由), ...] -> Excel で開ける BOM 付き CSV (bytes)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(REPORT_HEADER)
+    for line, discord_id, riot_id, bucket, reason in entries:
+        writer.writerow([line, discord_id, riot_id, BUCKET_LABELS[bucket], reason])
+    return buf.getvalue().encode("utf-8-sig")
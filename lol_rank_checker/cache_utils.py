@@ -0,0 +1,71 @@
+import asyncio
+import time
+from collections import OrderedDict
+from metrics import CACHE_REQUESTS
+from rate_limiter import SharedPriority, current_priority, priority
+
+
+# ==========================================
+# 小さなキャッシュ部品
+# ==========================================
+class TTLCache:
+    # 件数上限つきの LRU。ttl 秒を過ぎた値は無いものとして扱う
+    def __init__(self, maxsize=256, ttl=300.0, name="ttl"):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None: del self._data[key]
+            self.misses += 1
+            CACHE_REQUESTS.inc(cache=self.name, result="miss")
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        CACHE_REQUESTS.inc(cache=self.name, result="hit")
+        return item[1]
+
+    def put(self, key, value, ttl=None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class SingleFlight:
+    # 同じキーの処理が実行中なら、新しく始めずにその結果を一緒に待つ。
+    # 共有する処理の Riot API 優先度は、待っている呼び出し元の中で一番高いものになる
+    # (タスクは作成した呼び出し元の優先度を引き継ぐので、一括登録が始めた取得を /link が待つと遅くなるため)
+    def __init__(self):
+        self._inflight = {}
+        # 実行中のタスク -> SharedPriority
+        self._priorities = {}
+
+    async def run(self, key, coro_func):
+        task = self._inflight.get(key)
+        if task is None:
+            shared = SharedPriority(current_priority.get())
+            with priority(shared):
+                task = asyncio.ensure_future(coro_func())
+            self._inflight[key] = task
+            self._priorities[task] = shared
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            self._priorities[task].join(current_priority.get())
+        # 待っている側がキャンセルされても、共有している処理自体は止めない
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._inflight.get(key) is task: self._inflight.pop(key)
+        self._priorities.pop(task, None)
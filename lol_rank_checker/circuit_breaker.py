@@ -0,0 +1,54 @@
+import time
+from metrics import RIOT_CIRCUIT_STATE
+
+# ==========================================
+# サーキットブレーカー (Riot API のエンドポイント単位)
+# ==========================================
+# 5xx・タイムアウトが続いたら一定時間そのエンドポイントへの送信をやめ、すぐにエラーを返す。
+# 時間が経ったら1件だけ試しに通し、成功すれば元に戻す (失敗すればもう一度待つ)。
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # 連続した失敗の回数 (成功すると 0 に戻る)
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None: return STATE_CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout: return STATE_OPEN
+        return STATE_HALF_OPEN
+
+    def allow(self):
+        # 送ってよければ True (試しに通す1件は probing で他と区別する)
+        state = self.state
+        if state == STATE_CLOSED: return True
+        if state == STATE_OPEN or self.probing: return False
+        self.probing = True
+        return True
+
+    def record(self, ok):
+        # ok: True = Riot が応答した (4xx も含む) / False = 5xx・通信エラー / None = 判定しない (429・中断)
+        self.probing = False
+        if ok is None: return
+        if ok:
+            if self.opened_at is not None: print(f"🔌 Riot API 復旧: {self.name}")
+            self.failures = 0
+            self.opened_at = None
+        else:
+            self.failures += 1
+            if self.opened_at is None and self.failures < self.failure_threshold: return
+            if self.opened_at is None: print(f"🔌 Riot API 遮断 ({self.reset_timeout:.0f}秒): {self.name}")
+            self.opened_at = time.monotonic()
+        RIOT_CIRCUIT_STATE.set(0 if self.opened_at is None else 1, endpoint=self.name)
@@ -0,0 +1,164 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import UpdateOne
+from metrics import DB_LATENCY
+
+# ==========================================
+# MongoDB アクセス層 (イベントループを止めない)
+# ==========================================
+# pymongo は同期ドライバなので、すべての DB 操作を専用スレッドプールで実行し、
+# Discord のハートビートが DB 待ちで止まらないようにする。
+DB_POOL_SIZE = 20
+DB_TIMEOUT = 15.0
+
+# MongoClient に渡す接続設定 (無制限待ちはしない)
+MONGO_OPTIONS = {
+    "maxPoolSize": DB_POOL_SIZE,
+    "serverSelectionTimeoutMS": 10000,
+    "connectTimeoutMS": 10000,
+    "socketTimeoutMS": 15000,
+    "waitQueueTimeoutMS": 5000,
+}
+
+# ランキング用に上位何件を事前に保持しておくか
+LEADERBOARD_CACHE_SIZE = 50
+
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="mongo")
+
+
+async def run_db(func, *args, db_timeout=DB_TIMEOUT, db_op=None, **kwargs):
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    with DB_LATENCY.time(op=db_op or getattr(func, "__name__", "db")):
+        return await asyncio.wait_for(loop.run_in_executor(_executor, call), db_timeout)
+
+
+class LeaderboardCache:
+    # (サーバー, 項目) ごとの上位 N 件。書き込みがあれば捨てて、次の参照時に取り直す
+    def __init__(self, repo, size=LEADERBOARD_CACHE_SIZE):
+        self.repo = repo
+        self.size = size
+        self.rows = {}
+
+    def invalidate(self):
+        self.rows.clear()
+
+    async def get(self, guild_id, field):
+        if (guild_id, field) not in self.rows:
+            self.rows[(guild_id, field)] = await self.repo.top(guild_id, field, self.size)
+        return self.rows[(guild_id, field)]
+
+
+class UserRepository:
+    # 登録情報はサーバー (guild_id) ごと。同じ Discord ユーザーでもサーバーが違えば別の文書になる
+    def __init__(self, collection=None):
+        self.leaderboard = LeaderboardCache(self)
+        self.collection = collection
+
+    @property
+    def collection(self):
+        return self._collection
+
+    @collection.setter
+    def collection(self, collection):
+        # 接続し直したら手元の件数やランキングは当てにならないので捨てる
+        self._collection = collection
+        self.member_counts = {}
+        self.leaderboard.invalidate()
+
+    @property
+    def available(self):
+        return self.collection is not None
+
+    def create_indexes(self):
+        # 起動時に一度だけ呼ぶ (同期)
+        # 旧形式 (discord_id だけで一意) の索引があると別サーバーに同じ人を登録できないので作り直す
+        if self.collection.index_information().get("discord_id_1", {}).get("unique"):
+            self.collection.drop_index("discord_id_1")
+        self.collection.create_index([("guild_id", 1), ("discord_id", 1)], unique=True)
+        self.collection.create_index([("guild_id", 1), ("_id", 1)])
+        for field in ("discord_id", "puuid", "riot_key", "last_updated"):
+            self.collection.create_index(field)
+        # ランキング用 (/leaderboard win 7d などの伸びは stats_history が保存する trend)
+        for field in ("level", "win_rate", "kda", *(f"trend.{period}.{metric}.delta"
+                                                     for period in ("7d", "30d") for metric in ("win_rate", "kda"))):
+            self.collection.create_index([("guild_id", 1), (field, -1)])
+
+    def migrate_legacy(self, guild_id):
+        # サーバー対応前に保存された (guild_id の無い) 文書を指定サーバーのものにする (同期)
+        return self.collection.update_many({"guild_id": {"$exists": False}}, {"$set": {"guild_id": guild_id}})
+
+    async def upsert(self, guild_id, discord_id, fields):
+        result = await run_db(self.collection.update_one, {"guild_id": guild_id, "discord_id": discord_id},
+                              {"$set": fields}, upsert=True)
+        if result.upserted_id is not None: self._adjust_count(guild_id, 1)
+        self.leaderboard.invalidate()
+        return result
+
+    async def find(self, query=None, projection=None, sort=None, limit=0, skip=0):
+        def _find():
+            cursor = self.collection.find(query or {}, projection)
+            if sort: cursor = cursor.sort(sort)
+            if skip: cursor = cursor.skip(skip)
+            if limit: cursor = cursor.limit(limit)
+            return list(cursor)
+
+        return await run_db(_find, db_op="users.find")
+
+    async def find_after(self, guild_id, last_id, limit, projection=None):
+        # サーバー内を _id 昇順でたどるキーセットページング
+        query = {"guild_id": guild_id}
+        if last_id is not None: query["_id"] = {"$gt": last_id}
+        return await self.find(query, projection, sort=[("_id", 1)], limit=limit)
+
+    async def top(self, guild_id, field, limit, skip=0):
+        # インデックスを使ってサーバー側で並べ替え・件数制限する
+        projection = {"discord_id": 1, "riot_name": 1, field: 1}
+        return await self.find({"guild_id": guild_id}, projection, sort=[(field, -1)], limit=limit, skip=skip)
+
+    async def find_identity(self, key):
+        # Riot ID -> PUUID はサーバーに関係なく共通
+        return await run_db(self.collection.find_one, {"riot_key": key}, {"puuid": 1, "identity_checked_at": 1},
+                            sort=[("identity_checked_at", -1)])
+
+    async def count(self, guild_id):
+        return await run_db(self.collection.count_documents, {"guild_id": guild_id})
+
+    async def cached_count(self, guild_id):
+        # ダッシュボード用の登録人数。最初の1回だけ索引で数え、以後は自分の追加・削除で増減させる
+        if guild_id not in self.member_counts:
+            self.member_counts[guild_id] = await self.count(guild_id)
+        return self.member_counts[guild_id]
+
+    def external_write(self, guild_id, inserted=0):
+        # 別プロセス (ワーカー) が users に書き込んだ時に呼ぶ。このプロセスのキャッシュは自分の書き込みしか知らない。
+        # 人数は足し引きせず数え直させる (同じプロセスで動かした時に二重に数えないように)
+        if inserted: self.member_counts.pop(guild_id, None)
+        self.leaderboard.invalidate()
+
+    def _adjust_count(self, guild_id, delta):
+        if guild_id in self.member_counts: self.member_counts[guild_id] = max(self.member_counts[guild_id] + delta, 0)
+
+    async def delete(self, guild_id, discord_id):
+        result = await run_db(self.collection.delete_one, {"guild_id": guild_id, "discord_id": discord_id})
+        self._adjust_count(guild_id, -result.deleted_count)
+        self.leaderboard.invalidate()
+        return result
+
+    async def bulk_upsert(self, guild_id, items):
+        # items: [(discord_id, 更新内容), ...] を1回の bulk_write でまとめて保存する
+        ops = [UpdateOne({"guild_id": guild_id, "discord_id": discord_id}, {"$set": fields}, upsert=True)
+               for discord_id, fields in items]
+        if not ops: return None
+        result = await run_db(self.collection.bulk_write, ops, ordered=False, db_op="users.bulk_upsert")
+        self._adjust_count(guild_id, result.upserted_count)
+        self.leaderboard.invalidate()
+        return result
+
+    async def bulk_write(self, ops):
+        result = await run_db(self.collection.bulk_write, ops, ordered=False)
+        # どのサーバーの人数が変わったかは分からないので数え直させる
+        if result.upserted_count or result.deleted_count: self.member_counts.clear()
+        self.leaderboard.invalidate()
+        return result
@@ -1,10 +1,12 @@
 import requests
 import json
+import os
 
 # ============================
 # ここだけ書き換えてください
 # ============================
-API_KEY = "RGAPI-87c7b47c-1c9f-4e0a-a544-c0f585908c9c"
+# APIキーはコードに書かず、環境変数 RIOT_API_KEY から読む
+API_KEY = os.getenv("RIOT_API_KEY", "")
 GAME_NAME = "sikami0siki"
 TAG_LINE = "JP1"
 
@@ -0,0 +1,112 @@
+import csv
+import gzip
+import io
+import tempfile
+from db_repository import run_db
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+# ==========================================
+# 名簿エクスポート (CSV / CSV.gz / XLSX)
+# ==========================================
+# DB から少しずつ読み、一時ファイルに逐次書き出すのでメモリ使用量は名簿の大きさに依らない。
+# ファイルが Discord の添付上限を超えそうなら自動で分割する。
+EXPORT_FORMATS = ("csv", "csv.gz", "xlsx")
+EXPORT_BATCH_SIZE = 500
+DISCORD_FILE_LIMIT = 8 * 1024 * 1024
+SPOOL_MAX_MEMORY = 1024 * 1024
+XLSX_ROWS_PER_PART = 100000
+EXPORT_TIMEOUT = 300.0
+HEADER = ['Name', 'ID', 'Riot ID', 'Level', 'Link']
+
+
+def iter_member_rows(collection, guild_id, names):
+    projection = {"_id": 0, "discord_id": 1, "riot_name": 1, "riot_tag": 1, "level": 1}
+    for u in collection.find({"guild_id": guild_id}, projection).batch_size(EXPORT_BATCH_SIZE):
+        name_safe = u['riot_name'].replace(" ", "%20")
+        url = f"https://www.op.gg/summoners/jp/{name_safe}-{u['riot_tag']}"
+        yield [names.get(u['discord_id'], "Unknown"), u['discord_id'], f"{u['riot_name']}#{u['riot_tag']}",
+               u.get('level', 0), url]
+
+
+def _part_name(base, ext, index):
+    return f"{base}.{ext}" if index == 1 else f"{base}_part{index}.{ext}"
+
+
+def _write_csv_parts(rows, compress):
+    parts = []
+
+    def open_part():
+        raw = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        stream = gzip.GzipFile(fileobj=raw, mode="wb") if compress else raw
+        # Excel で日本語が文字化けしないよう BOM 付きで書く
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        csv.writer(text).writerow(HEADER)
+        return raw, stream, text
+
+    def close_part(raw, stream, text):
+        text.flush()
+        text.detach()
+        if compress: stream.close()
+        raw.seek(0)
+        parts.append((raw, _part_name("members", "csv.gz" if compress else "csv", len(parts) + 1)))
+
+    raw, stream, text = open_part()
+    writer = csv.writer(text)
+    for i, row in enumerate(rows):
+        # 一定行ごとにサイズを確認し、上限の9割を超えていたらこの行から次のファイルへ
+        # (書いた後ではなく次の行を書く前に切り替えるので、見出しだけのファイルはできない)
+        if i and i % 1000 == 0:
+            text.flush()
+            if raw.tell() > DISCORD_FILE_LIMIT * 0.9:
+                close_part(raw, stream, text)
+                raw, stream, text = open_part()
+                writer = csv.writer(text)
+        writer.writerow(row)
+    close_part(raw, stream, text)
+    return parts
+
+
+def _write_xlsx_parts(rows):
+    parts = []
+    wb = ws = None
+    count = 0
+
+    def save(wb):
+        raw = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        wb.save(raw)
+        raw.seek(0)
+        parts.append((raw, _part_name("members", "xlsx", len(parts) + 1)))
+
+    for row in rows:
+        if wb is None:
+            # write_only モードは行を一時ファイルに流すのでメモリに溜めない
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("members")
+            ws.append(HEADER)
+            count = 0
+        ws.append(row)
+        count += 1
+        if count >= XLSX_ROWS_PER_PART:
+            save(wb)
+            wb = None
+    if wb is not None or not parts:
+        if wb is None:
+            wb = Workbook(write_only=True)
+            wb.create_sheet("members").append(HEADER)
+        save(wb)
+    return parts
+
+
+def build_export(collection, guild_id, names, fmt):
+    rows = iter_member_rows(collection, guild_id, names)
+    if fmt == "xlsx": return _write_xlsx_parts(rows)
+    return _write_csv_parts(rows, compress=(fmt == "csv.gz"))
+
+
+async def export_members(collection, guild_id, names, fmt="csv"):
+    # DB 読み込みとファイル書き出しはまとめて DB 用スレッドで行う
+    return await run_db(build_export, collection, guild_id, names, fmt, db_timeout=EXPORT_TIMEOUT, db_op="export")
@@ -0,0 +1,90 @@
+from db_repository import run_db
+
+# ==========================================
+# サーバー (ギルド) ごとの設定
+# ==========================================
+# モード・基準値の上書き・レベル上限・管理者・ログチャンネルを guild_config コレクションに保存し、
+# 一度読んだものはメモリに置いて使い回す (書き込みもこのクラス経由なので古くならない)。
+GUILD_CONFIG_COLLECTION = "guild_config"
+CONFIG_FIELDS = ("mode", "max_level", "admin_id", "log_channel_id", "overrides")
+
+
+class GuildConfig:
+    def __init__(self, guild_id, presets, mode, max_level, admin_id=0, log_channel_id=0, overrides=None):
+        self.guild_id = guild_id
+        self.presets = presets
+        self.mode = mode if mode in presets else next(iter(presets))
+        self.max_level = max_level
+        self.admin_id = admin_id or 0
+        self.log_channel_id = log_channel_id or 0
+        # モード名 -> {項目: 値} (プリセットの基準値をサーバーごとに上書きする)
+        self.overrides = overrides or {}
+
+    @property
+    def thresholds(self):
+        return self.thresholds_for(self.mode)
+
+    def thresholds_for(self, mode):
+        return {**self.presets[mode], **self.overrides.get(mode, {})}
+
+    @property
+    def cache_key(self):
+        # 同じ基準で分析した結果は別サーバーでも使い回せる
+        return self.mode, tuple(sorted(self.thresholds.items())), self.max_level
+
+    def is_admin(self, user_id, guild=None):
+        # 管理者未設定のサーバーではサーバーオーナーを管理者とみなす
+        if self.admin_id: return user_id == self.admin_id
+        return guild is not None and user_id == guild.owner_id
+
+    def to_doc(self):
+        return {f: getattr(self, f) for f in CONFIG_FIELDS}
+
+
+class GuildConfigStore:
+    def __init__(self, presets, defaults, collection=None):
+        # defaults(guild_id) -> 保存された設定が無い時の値 (dict)
+        self.presets = presets
+        self.defaults = defaults
+        self.cache = {}
+        self.collection = collection
+
+    @property
+    def collection(self):
+        return self._collection
+
+    @collection.setter
+    def collection(self, collection):
+        self._collection = collection
+        self.cache.clear()
+
+    async def get(self, guild_id):
+        cfg = self.cache.get(guild_id)
+        if cfg is not None: return cfg
+        fields = dict(self.defaults(guild_id))
+        if self.collection is not None:
+            try:
+                doc = await run_db(self.collection.find_one, {"_id": guild_id}, db_op="guild_config.find")
+                if doc: fields.update({f: doc[f] for f in CONFIG_FIELDS if f in doc})
+            except Exception as e:
+                print(f"⚠️ サーバー設定読込スキップ: {e}")
+        cfg = GuildConfig(guild_id, self.presets, **fields)
+        self.cache[guild_id] = cfg
+        return cfg
+
+    async def update(self, guild_id, **fields):
+        # DB 未接続でもメモリ上は変更する (再接続すると保存済みの設定に戻る)
+        cfg = await self.get(guild_id)
+        for f, v in fields.items(): setattr(cfg, f, v)
+        if self.collection is not None:
+            try:
+                await run_db(self.collection.update_one, {"_id": guild_id}, {"$set": cfg.to_doc()}, upsert=True,
+                             db_op="guild_config.update")
+            except Exception as e:
+                print(f"⚠️ サーバー設定保存スキップ: {e}")
+        return cfg
+
+    async def set_threshold(self, guild_id, key, value):
+        cfg = await self.get(guild_id)
+        overrides = {**cfg.overrides, cfg.mode: {**cfg.overrides.get(cfg.mode, {}), key: value}}
+        return await self.update(guild_id, overrides=overrides)
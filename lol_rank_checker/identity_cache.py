@@ -0,0 +1,42 @@
+import datetime
+from cache_utils import TTLCache
+
+# ==========================================
+# Riot ID -> PUUID 解決キャッシュ
+# ==========================================
+# PUUID は変わらないが、名前#タグは変更されうるので IDENTITY_TTL ごとに account-v1 で確認し直す。
+# メモリの LRU に無ければ users コレクションに保存済みの riot_key / puuid を使う。
+IDENTITY_TTL = datetime.timedelta(days=7)
+IDENTITY_CACHE_SIZE = 1024
+
+
+def riot_key(name, tag):
+    return f"{name.strip().lower()}#{tag.strip().lower()}"
+
+
+class IdentityResolver:
+    def __init__(self, repo, maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_TTL):
+        self.repo = repo
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl.total_seconds(), name="identity")
+
+    async def lookup(self, name, tag):
+        # (puuid, 最後に account-v1 で確認した時刻) を返す。使えるものが無ければ None
+        key = riot_key(name, tag)
+        hit = self.memory.get(key)
+        if hit: return hit
+        if not self.repo.available: return None
+        try:
+            doc = await self.repo.find_identity(key)
+        except Exception as e:
+            print(f"⚠️ ID解決キャッシュ読込スキップ: {e}")
+            return None
+        checked_at = doc.get("identity_checked_at") if doc else None
+        if not checked_at: return None
+        remaining = (checked_at + self.ttl - datetime.datetime.now()).total_seconds()
+        if remaining <= 0: return None
+        self.memory.put(key, (doc["puuid"], checked_at), ttl=remaining)
+        return doc["puuid"], checked_at
+
+    def remember(self, name, tag, puuid, checked_at):
+        self.memory.put(riot_key(name, tag), (puuid, checked_at))
@@ -0,0 +1,102 @@
+import asyncio
+import datetime
+from pymongo import ReturnDocument
+from db_repository import run_db
+
+# ==========================================
+# 分析ジョブのキュー (MongoDB)
+# ==========================================
+# Bot 本体 (Discord 接続) はジョブを積んで結果を待つだけにし、Riot API の取得・集計・DB 保存は
+# worker.py (別プロセス、何台でも可) が行う。取り出しは find_one_and_update で1件ずつ原子的に行い、
+# 取り出したワーカーは期限 (リース) を延長し続ける。ワーカーが落ちて期限が切れたジョブは別のワーカーが拾い直す。
+JOB_COLLECTION = "jobs"
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+# 終わったジョブを消すまでの時間 (秒)
+FINISHED_JOB_TTL = 24 * 3600
+RESULT_POLL_INTERVAL = 0.5
+
+# 小さいほど先に処理する (/link を監査・一括登録より優先する)
+JOB_PRIORITY = {"link": 0, "audit": 1, "import": 1}
+
+
+class JobQueue:
+    def __init__(self, collection=None):
+        self.collection = collection
+
+    @property
+    def available(self):
+        return self.collection is not None
+
+    def create_indexes(self):
+        # 起動時に一度だけ呼ぶ (同期)
+        self.collection.create_index([("status", 1), ("priority", 1), ("created", 1)])
+        self.collection.create_index([("status", 1), ("lease_until", 1)])
+        self.collection.create_index("finished_at", expireAfterSeconds=FINISHED_JOB_TTL)
+
+    async def enqueue(self, kind, payload):
+        now = datetime.datetime.now()
+        doc = {"kind": kind, "payload": payload, "status": "queued", "priority": JOB_PRIORITY.get(kind, 9),
+               "attempts": 0, "created": now, "lease_until": None, "worker": None}
+        result = await run_db(self.collection.insert_one, doc, db_op="jobs.enqueue")
+        return result.inserted_id
+
+    async def claim(self, worker_id):
+        # 待ち状態のジョブか、期限切れで放置されたジョブを1件取り出す
+        now = datetime.datetime.now()
+        query = {"$or": [{"status": "queued"}, {"status": "running", "lease_until": {"$lt": now}}],
+                 "attempts": {"$lt": MAX_ATTEMPTS}}
+        update = {"$set": {"status": "running", "worker": worker_id,
+                           "lease_until": now + datetime.timedelta(seconds=LEASE_SECONDS)},
+                  "$inc": {"attempts": 1}}
+        return await run_db(self.collection.find_one_and_update, query, update,
+                            sort=[("priority", 1), ("created", 1)], return_document=ReturnDocument.AFTER,
+                            db_op="jobs.claim")
+
+    async def extend(self, job_id, worker_id):
+        # まだ自分が持っているジョブだけ延長する (False なら他のワーカーに取られている)
+        until = datetime.datetime.now() + datetime.timedelta(seconds=LEASE_SECONDS)
+        result = await run_db(self.collection.update_one, {"_id": job_id, "worker": worker_id, "status": "running"},
+                              {"$set": {"lease_until": until}}, db_op="jobs.extend")
+        return result.modified_count == 1
+
+    async def complete(self, job_id, worker_id, result):
+        await self._finish(job_id, worker_id, {"status": "done", "result": result})
+
+    async def fail(self, job, worker_id, error):
+        # 回数が残っていれば待ち状態に戻して再試行させる
+        if job["attempts"] < MAX_ATTEMPTS:
+            await run_db(self.collection.update_one, {"_id": job["_id"], "worker": worker_id},
+                         {"$set": {"status": "queued", "worker": None, "lease_until": None, "error": error}},
+                         db_op="jobs.retry")
+        else:
+            await self._finish(job["_id"], worker_id, {"status": "failed", "error": error})
+
+    async def _finish(self, job_id, worker_id, fields):
+        await run_db(self.collection.update_one, {"_id": job_id, "worker": worker_id},
+                     {"$set": {**fields, "finished_at": datetime.datetime.now()}}, db_op="jobs.finish")
+
+    async def expire_abandoned(self):
+        # 期限切れのまま再試行回数を使い切ったジョブを失敗扱いにする
+        now = datetime.datetime.now()
+        await run_db(self.collection.update_many,
+                     {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$gte": MAX_ATTEMPTS}},
+                     {"$set": {"status": "failed", "error": "lease expired", "finished_at": now}},
+                     db_op="jobs.expire")
+
+    async def wait(self, job_ids, timeout):
+        # 終わったジョブ (done / failed) を {job_id: 文書} で返す。timeout までに終わらなかったものは含まれない
+        pending = set(job_ids)
+        finished = {}
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while pending:
+            docs = await run_db(lambda: [*self.collection.find(
+                {"_id": {"$in": [*pending]}, "status": {"$in": ["done", "failed"]}},
+                {"status": 1, "result": 1, "error": 1})], db_op="jobs.wait")
+            for d in docs:
+                finished[d["_id"]] = d
+                pending.discard(d["_id"])
+            if not pending or loop.time() >= deadline: break
+            await asyncio.sleep(RESULT_POLL_INTERVAL)
+        return finished
@@ -1,12 +1,31 @@
-from flask import Flask
+from flask import Flask, Response, jsonify
 from threading import Thread
+import metrics
 
 app = Flask('')
 
+# 名前 -> 状態を返す関数 (bot.py から登録する)
+health_checks = {}
+
 @app.route('/')
 def home():
     return "I'm alive"
 
+@app.route('/metrics')
+def metrics_page():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/healthz')
+def healthz():
+    results = {}
+    for name, check in health_checks.items():
+        try:
+            results[name] = bool(check())
+        except Exception:
+            results[name] = False
+    ok = all(results.values())
+    return jsonify(status="ok" if ok else "degraded", checks=results), 200 if ok else 503
+
 def run():
     app.run(host='0.0.0.0', port=8080)
 
@@ -0,0 +1,63 @@
+from db_repository import run_db
+from metrics import CACHE_REQUESTS
+from pymongo.errors import BulkWriteError
+
+# ==========================================
+# 試合詳細キャッシュ (MongoDB capped collection)
+# ==========================================
+# 終了した試合のデータは変わらないので match_id をキーに永続化する。
+# capped collection なので上限サイズを超えると古い試合から自動で消える。
+MATCH_CACHE_COLLECTION = "match_cache"
+
+# 集計ループで実際に読む項目だけを保存する
+PARTICIPANT_FIELDS = (
+    "puuid", "teamId", "win", "kills", "deaths", "assists",
+    "totalMinionsKilled", "neutralMinionsKilled", "goldEarned", "totalDamageDealtToChampions",
+    "item0", "item1", "item2", "item3", "item4", "item5",
+)
+
+
+def init_match_collection(db, max_bytes):
+    if MATCH_CACHE_COLLECTION not in db.list_collection_names():
+        db.create_collection(MATCH_CACHE_COLLECTION, capped=True, size=max_bytes)
+    return db[MATCH_CACHE_COLLECTION]
+
+
+def compact_match(match_id, match):
+    info = match['info']
+    return {
+        "_id": match_id,
+        "info": {
+            "gameDuration": info['gameDuration'],
+            "gameCreation": info.get('gameCreation', 0),
+            "participants": [{f: p.get(f, 0) for f in PARTICIPANT_FIELDS} for p in info['participants']]
+        }
+    }
+
+
+class MatchCache:
+    def __init__(self, collection=None):
+        self.collection = collection
+
+    async def get_many(self, match_ids):
+        if self.collection is None or not match_ids: return {}
+        try:
+            docs = await run_db(lambda: list(self.collection.find({"_id": {"$in": list(match_ids)}})),
+                                db_op="match_cache.find")
+            CACHE_REQUESTS.inc(len(docs), cache="match", result="hit")
+            CACHE_REQUESTS.inc(len(match_ids) - len(docs), cache="match", result="miss")
+            return {d["_id"]: d for d in docs}
+        except Exception as e:
+            print(f"⚠️ 試合キャッシュ読込スキップ: {e}")
+            return {}
+
+    async def put_many(self, docs):
+        docs = list(docs)
+        if self.collection is None or not docs: return
+        try:
+            await run_db(self.collection.insert_many, docs, ordered=False)
+        except BulkWriteError:
+            # 同じ試合を別の分析が先に保存していた場合 (重複キー) は無視してよい
+            pass
+        except Exception as e:
+            print(f"⚠️ 試合キャッシュ保存スキップ: {e}")
@@ -0,0 +1,109 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# ==========================================
+# メトリクス (Prometheus テキスト形式)
+# ==========================================
+# Bot 本体 (asyncio) と keep_alive (Flask スレッド) の両方から触るのでロックで守る。
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _label_str(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items: return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_label_str(labels)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            # [バケットごとの件数, 合計, 件数]
+            entry = self.values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, b in enumerate(self.buckets):
+                if value <= b: entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, n) in sorted(self.values.items()):
+            for b, c in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_label_str(key, [('le', b)])} {c}")
+            lines.append(f"{self.name}_bucket{_label_str(key, [('le', '+Inf')])} {n}")
+            lines.append(f"{self.name}_sum{_label_str(key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(key)} {n}")
+        return lines
+
+
+def render():
+    with _lock:
+        lines = []
+        for m in _registry: lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------- 計測項目 ----------
+RIOT_REQUESTS = Counter("riot_api_requests_total", "Riot API requests by endpoint and HTTP status")
+RIOT_LATENCY = Histogram("riot_api_request_duration_seconds", "Riot API request latency by endpoint")
+RIOT_RETRIES = Counter("riot_api_retries_total", "Riot API retries by endpoint and reason")
+RIOT_RATE_LIMITED = Counter("riot_api_429_total", "Riot API 429 responses by endpoint")
+RIOT_CIRCUIT_STATE = Gauge("riot_api_circuit_open", "1 while the circuit breaker for an endpoint is open")
+RIOT_CIRCUIT_REJECTED = Counter("riot_api_circuit_rejected_total", "Requests failed fast by an open circuit breaker")
+LIMITER_WAIT = Histogram("riot_rate_limiter_wait_seconds", "Time spent waiting for the rate limiter")
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by cache name and result (hit/miss)")
+DB_LATENCY = Histogram("db_operation_duration_seconds", "MongoDB operation latency by operation")
+COMMAND_LATENCY = Histogram("discord_command_duration_seconds", "Command latency by command name and status")
+LOOP_LAG = Gauge("event_loop_lag_seconds", "How late the asyncio event loop woke up on the last probe")
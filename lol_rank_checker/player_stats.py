@@ -0,0 +1,52 @@
+import datetime
+from db_repository import run_db
+from stats_engine import SUM_KEYS
+
+# ==========================================
+# プレイヤー別の累積集計 (差分更新用)
+# ==========================================
+# 直近 WINDOW_SIZE 試合ぶんの 1試合ごとの寄与と、その合計値を puuid ごとに保存する。
+# 再分析時は前回より新しい試合だけを取得して合計に足し、窓から外れた試合を引く。
+WINDOW_SIZE = 20
+PLAYER_STATS_COLLECTION = "player_stats"
+
+
+def empty_state(puuid):
+    return {"_id": puuid, "games": [], "sums": {k: 0 for k in SUM_KEYS},
+            "last_match_id": None, "last_match_time": 0}
+
+
+def merge_games(state, new_entries, window=WINDOW_SIZE):
+    # 新しい試合を足し、窓から外れた古い試合を合計から引く
+    known = {g["id"] for g in state["games"]}
+    sums = state["sums"]
+    for e in new_entries:
+        if e["id"] in known: continue
+        state["games"].append(e)
+        for k in SUM_KEYS: sums[k] += e[k]
+    state["games"].sort(key=lambda g: g["t"], reverse=True)
+    for old in state["games"][window:]:
+        for k in SUM_KEYS: sums[k] -= old[k]
+    del state["games"][window:]
+    return state
+
+
+class PlayerStatsStore:
+    def __init__(self, collection=None):
+        self.collection = collection
+
+    async def load(self, puuid):
+        if self.collection is None: return None
+        try:
+            return await run_db(self.collection.find_one, {"_id": puuid})
+        except Exception as e:
+            print(f"⚠️ 集計データ読込スキップ: {e}")
+            return None
+
+    async def save(self, state):
+        if self.collection is None: return
+        try:
+            state["updated"] = datetime.datetime.now()
+            await run_db(self.collection.replace_one, {"_id": state["_id"]}, state, upsert=True)
+        except Exception as e:
+            print(f"⚠️ 集計データ保存スキップ: {e}")
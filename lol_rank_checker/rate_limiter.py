@@ -0,0 +1,216 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# ==========================================
+# Riot API レート制限 (ヘッダー駆動)
+# ==========================================
+# 最初のレスポンスが返るまでは開発キーの既定値で制限する
+DEFAULT_APP_LIMITS = "20:1,100:120"
+
+# 優先度: /link や /dashboard など人が待っているものを先に通す
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+# 各ウィンドウのうちバックグラウンド処理が使ってはいけない割合 (対話的な処理のために残す)
+INTERACTIVE_RESERVE = 0.2
+# これ以上待たされたバックグラウンド処理は対話的な処理と同じ扱いにする (飢餓防止)
+STARVATION_SECONDS = 30.0
+# 対話的な処理が待っている間、バックグラウンド処理が譲る時の再確認間隔
+YIELD_INTERVAL = 0.05
+
+# 現在のタスクの優先度。asyncio のタスクは作成時にこれを引き継ぐので、
+# 監査などの入口で一度設定すれば、その中の全 Riot API 呼び出しに効く
+current_priority = ContextVar("riot_priority", default=PRIORITY_INTERACTIVE)
+
+
+class SharedPriority:
+    # 複数の呼び出し元が結果を待つ共有タスク (SingleFlight) の優先度。待っている呼び出し元の中で一番高いものを使う。
+    # 値を毎回計算し直すので、監査が始めた取得に後から /link が合流すれば、その時点から対話的な扱いになる
+    def __init__(self, creator):
+        # creator / 合流した側の優先度 (数値か、入れ子の共有タスクなら SharedPriority)
+        self.sources = [creator]
+
+    @property
+    def value(self):
+        return min(resolve_priority(p) for p in self.sources)
+
+    def join(self, value):
+        self.sources.append(value)
+
+
+def resolve_priority(value):
+    return value.value if isinstance(value, SharedPriority) else value
+
+
+def effective_priority():
+    return resolve_priority(current_priority.get())
+
+
+@contextmanager
+def priority(value):
+    token = current_priority.set(value)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def parse_rate_header(value):
+    # "20:1,100:120" -> [(20, 1), (100, 120)]
+    pairs = []
+    for part in (value or "").split(","):
+        if ":" not in part: continue
+        a, b = part.split(":", 1)
+        try:
+            pairs.append((int(a), int(b)))
+        except ValueError:
+            continue
+    return pairs
+
+
+class RateBucket:
+    # Riot と同じ固定ウィンドウ方式: 最初のリクエストから window 秒間に limit 回まで
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.count = 0
+        self.window_start = 0.0
+
+    def wait_time(self, now, reserve=0.0):
+        if now >= self.window_start + self.window:
+            return 0.0
+        if self.count < self.limit - int(self.limit * reserve):
+            return 0.0
+        return self.window_start + self.window - now
+
+    def consume(self, now):
+        if now >= self.window_start + self.window:
+            self.window_start = now
+            self.count = 0
+        self.count += 1
+
+    def budget(self, now, seconds):
+        # 今から seconds 秒の間に、このバケットで送れる回数の目安
+        if now >= self.window_start + self.window:
+            remaining, reset_at = self.limit, now + self.window
+        else:
+            remaining, reset_at = max(self.limit - self.count, 0), self.window_start + self.window
+        # 期間中に新しく始まるウィンドウの分も足す
+        if now + seconds > reset_at:
+            remaining += (int((now + seconds - reset_at) // self.window) + 1) * self.limit
+        return remaining
+
+    def sync(self, limit, count, now):
+        # サーバー側のカウントの方が多ければ (他プロセス等) そちらに合わせる
+        self.limit = limit
+        if now >= self.window_start + self.window:
+            self.window_start = now
+            self.count = count
+        else:
+            self.count = max(self.count, count)
+
+
+class RateLimiter:
+    def __init__(self, default_app_limits=DEFAULT_APP_LIMITS):
+        self.default_app_limits = parse_rate_header(default_app_limits)
+        # (リージョン, "app" または メソッド名) -> {window秒: RateBucket}
+        self.buckets = {}
+        # (リージョン, スコープ) -> この時刻まで送信禁止 (429 の Retry-After)
+        self.blocked_until = {}
+        # リージョン -> 枠待ちしている対話的リクエストの数
+        self.interactive_waiting = {}
+        self._lock = asyncio.Lock()
+
+    def _scope_buckets(self, region, scope):
+        key = (region, scope)
+        if key not in self.buckets:
+            defaults = self.default_app_limits if scope == "app" else []
+            self.buckets[key] = {w: RateBucket(l, w) for l, w in defaults}
+        return self.buckets[key]
+
+    def _wait_time(self, region, method, now, reserve=0.0):
+        wait = 0.0
+        for scope in ("app", method):
+            wait = max(wait, self.blocked_until.get((region, scope), 0.0) - now)
+            for b in self._scope_buckets(region, scope).values():
+                wait = max(wait, b.wait_time(now, reserve))
+        return wait
+
+    async def acquire(self, region, method, priority=None):
+        # priority を省略した時は待っている間も優先度を見直す (共有タスクに対話的な呼び出し元が合流した時など)
+        fixed = priority
+        # 共有タスクの優先度は待っている間に上がることがあるので、長く眠らずに見直す
+        shared = fixed is None and isinstance(current_priority.get(), SharedPriority)
+        enqueued = time.monotonic()
+        waiting = False
+        try:
+            while True:
+                priority = effective_priority() if fixed is None else fixed
+                async with self._lock:
+                    now = time.monotonic()
+                    starving = now - enqueued >= STARVATION_SECONDS
+                    if priority == PRIORITY_BACKGROUND and not starving:
+                        # 対話的なリクエストが待っていれば譲り、予約分の枠にも手を付けない
+                        if self.interactive_waiting.get(region, 0) > 0:
+                            wait = YIELD_INTERVAL
+                        else:
+                            wait = self._wait_time(region, method, now, INTERACTIVE_RESERVE)
+                    else:
+                        wait = self._wait_time(region, method, now)
+                    if wait <= 0:
+                        for scope in ("app", method):
+                            for b in self._scope_buckets(region, scope).values():
+                                b.consume(now)
+                        return
+                    if priority == PRIORITY_INTERACTIVE and not waiting:
+                        waiting = True
+                        self.interactive_waiting[region] = self.interactive_waiting.get(region, 0) + 1
+                if shared and priority == PRIORITY_BACKGROUND: wait = min(wait, YIELD_INTERVAL)
+                await asyncio.sleep(wait)
+        finally:
+            if waiting: self.interactive_waiting[region] -= 1
+
+    def budget(self, region, method, seconds):
+        # バックグラウンド処理がどれだけ送ってよいかを決めるための残り枠
+        now = time.monotonic()
+        budget = float("inf")
+        for scope in ("app", method):
+            if self.blocked_until.get((region, scope), 0.0) > now: return 0
+            for b in self._scope_buckets(region, scope).values():
+                budget = min(budget, b.budget(now, seconds))
+        return 0 if budget == float("inf") else int(budget)
+
+    def _sync_scope(self, region, scope, limit_header, count_header, now):
+        limits = parse_rate_header(limit_header)
+        if not limits: return
+        counts = {w: c for c, w in parse_rate_header(count_header)}
+        windows = {w for _, w in limits}
+        buckets = self._scope_buckets(region, scope)
+        for limit, window in limits:
+            if window not in buckets:
+                buckets[window] = RateBucket(limit, window)
+            buckets[window].sync(limit, counts.get(window, 0), now)
+        # ヘッダーから消えたウィンドウ (既定値など) は捨てる
+        for window in [w for w in buckets if w not in windows]:
+            del buckets[window]
+
+    def update(self, region, method, headers):
+        now = time.monotonic()
+        self._sync_scope(region, "app", headers.get("X-App-Rate-Limit"), headers.get("X-App-Rate-Limit-Count"), now)
+        self._sync_scope(region, method, headers.get("X-Method-Rate-Limit"), headers.get("X-Method-Rate-Limit-Count"),
+                         now)
+
+    def penalize(self, region, method, headers):
+        # 429: Retry-After 秒だけ該当スコープを止める (service 由来の場合はメソッドだけ止める)
+        try:
+            retry_after = float(headers.get("Retry-After", 1))
+        except ValueError:
+            retry_after = 1.0
+        scope = "app" if headers.get("X-Rate-Limit-Type") == "application" else method
+        key = (region, scope)
+        self.blocked_until[key] = max(self.blocked_until.get(key, 0.0), time.monotonic() + retry_after)
+
+
+# プロセス全体で共有するリミッター (/link と /audit が同じ枠を使う)
+limiter = RateLimiter()
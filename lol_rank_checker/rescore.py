@@ -0,0 +1,48 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from stats_engine import summarize_batch
+
+# ==========================================
+# 再採点 (Riot API を使わない)
+# ==========================================
+# users に保存した直近の合計値 (sums) から指標を出し直し、基準値と比べる。
+# モードや基準値を変えた時の影響を、名簿全体について一度の計算で確認できる。
+THRESHOLD_KEYS = ("win_rate", "kda", "cspm", "gpm", "dmg")
+THRESHOLD_LABELS = {"win_rate": "勝率", "kda": "KDA", "cspm": "CS/分", "gpm": "Gold/分", "dmg": "DMGシェア"}
+
+
+def crossed_limits(summaries, thresholds):
+    # 各メンバーが基準値以上になっている項目 (集計なしは None)
+    limits = [thresholds[k] for k in THRESHOLD_KEYS]
+    if np is None:
+        return [None if s is None else {k for k, t in zip(THRESHOLD_KEYS, limits) if s[k] >= t} for s in summaries]
+    values = np.array([[s[k] for k in THRESHOLD_KEYS] if s else [np.nan] * len(THRESHOLD_KEYS) for s in summaries],
+                      dtype=float).reshape(-1, len(THRESHOLD_KEYS))
+    flags = values >= np.array(limits, dtype=float)
+    return [None if s is None else {k for k, f in zip(THRESHOLD_KEYS, row) if f}
+            for s, row in zip(summaries, flags.tolist())]
+
+
+def rescore(members, old_thresholds, new_thresholds):
+    # members: sums を持つ users 文書。新旧の基準で判定し直し、変化をメンバーごとに返す
+    scored = [m for m in members if m.get("sums")]
+    summaries = summarize_batch([m["sums"] for m in scored])
+    old = crossed_limits(summaries, old_thresholds)
+    new = crossed_limits(summaries, new_thresholds)
+    results = []
+    for m, s, before, after in zip(scored, summaries, old, new):
+        if s is None: continue
+        results.append({"member": m, "summary": s, "crossed": after, "added": after - before,
+                        "cleared": before - after})
+    return results
+
+
+def describe(result, thresholds, keys):
+    # "KDA 4.6/4.0, 勝率 62.0/60%" のような表示
+    s = result["summary"]
+    unit = {"win_rate": "%", "dmg": "%"}
+    return ", ".join(f"{THRESHOLD_LABELS[k]} {round(s[k], 1)}/{thresholds[k]}{unit.get(k, '')}"
+                     for k in THRESHOLD_KEYS if k in keys)
@@ -0,0 +1,177 @@
+import asyncio
+import time
+import aiohttp
+from urllib.parse import quote
+from rate_limiter import limiter as shared_limiter, effective_priority, PRIORITY_BACKGROUND, INTERACTIVE_RESERVE, \
+    YIELD_INTERVAL
+from circuit_breaker import CircuitBreaker, STATE_CLOSED
+from metrics import RIOT_REQUESTS, RIOT_LATENCY, RIOT_RATE_LIMITED, LIMITER_WAIT, RIOT_CIRCUIT_REJECTED
+
+
+# ==========================================
+# 非同期 Riot API クライアント
+# ==========================================
+# レート制限のメソッド単位の枠を区別するための名前
+METHOD_ACCOUNT = "account-v1.by_riot_id"
+METHOD_SUMMONER = "summoner-v4.by_puuid"
+METHOD_MATCHLIST = "match-v5.matchlist"
+METHOD_MATCH = "match-v5.by_id"
+
+# クライアントのメソッド名 -> METHOD_* (リトライ回数などのメトリクスのラベルを揃えるため)
+ENDPOINT_METHODS = {"account_by_riot_id": METHOD_ACCOUNT, "summoner_by_puuid": METHOD_SUMMONER,
+                    "matchlist_by_puuid": METHOD_MATCHLIST, "match_by_id": METHOD_MATCH}
+
+
+def endpoint_of(func):
+    return ENDPOINT_METHODS.get(func.__name__, func.__name__)
+
+
+class RiotApiError(Exception):
+    # riotwatcher の ApiError と同じく status_code で分岐できるようにしておく
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        super().__init__(f"{status_code} {text[:300]}")
+
+    @property
+    def upstream_failure(self):
+        # Riot 側 (または途中の Cloudflare・通信経路) の障害。0 はタイムアウト・接続エラー
+        return self.status_code == 0 or self.status_code >= 500
+
+
+class CircuitOpenError(RiotApiError):
+    # サーキットブレーカーが開いていて送信しなかった
+    def __init__(self, method):
+        super().__init__(503, f"Circuit open: {method}")
+
+
+DEFAULT_BASE_URL = "https://{region}.api.riotgames.com"
+
+
+class AsyncRiotClient:
+    def __init__(self, api_key, timeout=20.0, max_concurrency=10, limiter=None, base_url=DEFAULT_BASE_URL):
+        self.api_key = api_key
+        # ベンチマーク時はローカルの代替サーバーに向ける
+        self.base_url = base_url
+        self.limiter = limiter or shared_limiter
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._session = None
+        self._semaphore = None
+        self._background_semaphore = None
+        # エンドポイント (METHOD_*) -> CircuitBreaker
+        self.breakers = {}
+        # ヘルスチェック用: 最後に成功/失敗 (5xx・通信エラー) した時刻
+        self.last_success = 0.0
+        self.last_failure = 0.0
+
+    def healthy(self, window=60.0):
+        # 直近 window 秒に失敗があり、その後に成功していなければ不調とみなす
+        if any(b.state != STATE_CLOSED for b in self.breakers.values()): return False
+        if self.last_failure < time.monotonic() - window: return True
+        return self.last_success > self.last_failure
+
+    def _get_session(self):
+        # イベントループ上で初めて使われた時にセッションを作る (keep-alive で接続を使い回す)
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency * 2, ttl_dns_cache=300,
+                                             keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"X-Riot-Token": self.api_key}
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            # バックグラウンド処理は同時接続の一部しか使えないようにして、対話的な処理の席を残す
+            reserved = max(1, int(self.max_concurrency * INTERACTIVE_RESERVE))
+            self._background_semaphore = asyncio.Semaphore(max(1, self.max_concurrency - reserved))
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def breaker(self, method):
+        if method not in self.breakers: self.breakers[method] = CircuitBreaker(method)
+        return self.breakers[method]
+
+    async def request(self, region, method, path, params=None):
+        # 障害中のエンドポイントにはリミッターの枠も使わずに失敗を返す
+        breaker = self.breaker(method)
+        if not breaker.allow():
+            RIOT_CIRCUIT_REJECTED.inc(endpoint=method)
+            raise CircuitOpenError(method)
+        session = self._get_session()
+        url = self.base_url.format(region=region) + path
+        ok = None
+        background = False
+        try:
+            background = effective_priority() == PRIORITY_BACKGROUND and await self._acquire_background()
+            with LIMITER_WAIT.time(endpoint=method):
+                await self.limiter.acquire(region, method)
+            data = await self._send(session, url, region, method, params)
+            ok = True
+            return data
+        except RiotApiError as e:
+            if e.status_code != 429: ok = not e.upstream_failure
+            raise
+        finally:
+            breaker.record(ok)
+            if background: self._background_semaphore.release()
+
+    async def _acquire_background(self):
+        # バックグラウンド用の席を待つ。待っている間に優先度が上がったら席を取らずに進む (False を返す)
+        while effective_priority() == PRIORITY_BACKGROUND:
+            try:
+                await asyncio.wait_for(self._background_semaphore.acquire(), YIELD_INTERVAL)
+                return True
+            except asyncio.TimeoutError:
+                continue
+        return False
+
+    async def _send(self, session, url, region, method, params):
+        async with self._semaphore:
+            start = time.perf_counter()
+            status = "error"
+            try:
+                async with session.get(url, params=params) as resp:
+                    status = str(resp.status)
+                    # 毎回のレスポンスヘッダーで制限値と使用回数を同期する
+                    self.limiter.update(region, method, resp.headers)
+                    if resp.status == 429:
+                        RIOT_RATE_LIMITED.inc(endpoint=method)
+                        self.limiter.penalize(region, method, resp.headers)
+                    if resp.status >= 500:
+                        self.last_failure = time.monotonic()
+                    if resp.status != 200:
+                        raise RiotApiError(resp.status, await resp.text(), dict(resp.headers))
+                    data = await resp.json(content_type=None)
+                    self.last_success = time.monotonic()
+                    return data
+            except asyncio.TimeoutError:
+                self.last_failure = time.monotonic()
+                raise RiotApiError(0, "Connection timeout")
+            except aiohttp.ClientError as e:
+                self.last_failure = time.monotonic()
+                raise RiotApiError(0, f"Connection error: {e}")
+            finally:
+                RIOT_REQUESTS.inc(endpoint=method, status=status)
+                RIOT_LATENCY.observe(time.perf_counter() - start, endpoint=method)
+
+    # ---------- 各エンドポイント ----------
+    async def account_by_riot_id(self, region, game_name, tag_line):
+        path = f"/riot/account/v1/accounts/by-riot-id/{quote(game_name)}/{quote(tag_line)}"
+        return await self.request(region, METHOD_ACCOUNT, path)
+
+    async def summoner_by_puuid(self, region, puuid):
+        return await self.request(region, METHOD_SUMMONER, f"/lol/summoner/v4/summoners/by-puuid/{puuid}")
+
+    async def matchlist_by_puuid(self, region, puuid, count=20, start_time=None):
+        params = {"start": 0, "count": count}
+        if start_time: params["startTime"] = start_time
+        return await self.request(region, METHOD_MATCHLIST, f"/lol/match/v5/matches/by-puuid/{puuid}/ids",
+                                  params=params)
+
+    async def match_by_id(self, region, match_id):
+        return await self.request(region, METHOD_MATCH, f"/lol/match/v5/matches/{match_id}")
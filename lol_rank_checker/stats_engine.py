@@ -0,0 +1,153 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ==========================================
+# 集計エンジン (通信なしの純粋な計算)
+# ==========================================
+# 1試合ぶんの寄与 (game entry) と、その合計 (sums) から各指標と荒らし判定を出す。
+# まとめて計算する *_batch 関数は NumPy があればベクトル化して一度に処理する。
+MIN_GAME_SECONDS = 300
+
+SUM_KEYS = ("wins", "valid", "kills", "deaths", "assists", "cspm", "gpm", "dmg_share",
+            "troll_deaths", "troll_items", "troll_dmg", "troll_ff")
+
+
+def game_metrics(match_id, info, puuid):
+    # 1試合ぶんの寄与を計算する (集計対象外の試合は None)
+    if info['gameDuration'] < MIN_GAME_SECONDS: return None
+    me = next((p for p in info['participants'] if p['puuid'] == puuid), None)
+    if not me: return None
+
+    duration_min = info['gameDuration'] / 60
+    team_dmg = sum(p['totalDamageDealtToChampions'] for p in info['participants'] if p['teamId'] == me['teamId'])
+    share = (me['totalDamageDealtToChampions'] / team_dmg) * 100 if team_dmg > 0 else 0.0
+    item_cnt = sum(1 for i in range(6) if me.get(f'item{i}', 0) != 0)
+
+    return {
+        "id": match_id,
+        "t": info.get('gameCreation', 0),
+        "wins": 1 if me['win'] else 0,
+        "valid": 1,
+        "kills": me['kills'],
+        "deaths": me['deaths'],
+        "assists": me['assists'],
+        "cspm": (me['totalMinionsKilled'] + me['neutralMinionsKilled']) / duration_min,
+        "gpm": me['goldEarned'] / duration_min,
+        "dmg_share": share,
+        "troll_deaths": 1 if me['deaths'] >= 12 else 0,
+        "troll_items": 1 if item_cnt <= 1 and duration_min > 10 else 0,
+        "troll_dmg": 1 if team_dmg > 0 and share < 5.0 else 0,
+        "troll_ff": 1 if not me['win'] and info['gameDuration'] < 1200 else 0,
+    }
+
+
+def game_metrics_batch(records):
+    # records: [(match_id, info, puuid), ...] -> 集計対象の試合の寄与だけを返す
+    if np is None:
+        return [e for e in (game_metrics(*r) for r in records) if e]
+
+    team_keys, team_dmg_rows = [], []
+    picked, mine, my_team = [], [], []
+    for r, (match_id, info, puuid) in enumerate(records):
+        me = None
+        for p in info['participants']:
+            team_keys.append(r * 1000 + p['teamId'])
+            team_dmg_rows.append(p['totalDamageDealtToChampions'])
+            if me is None and p['puuid'] == puuid: me = p
+        if me is None or info['gameDuration'] < MIN_GAME_SECONDS: continue
+        picked.append(r)
+        mine.append(me)
+        my_team.append(r * 1000 + me['teamId'])
+    if not picked: return []
+
+    # チーム合計ダメージを全試合ぶん一度に集計する
+    keys, inverse = np.unique(np.asarray(team_keys), return_inverse=True)
+    team_totals = np.bincount(inverse, weights=np.asarray(team_dmg_rows, dtype=float))
+    team_dmg = team_totals[np.searchsorted(keys, np.asarray(my_team))]
+
+    duration = np.array([records[r][1]['gameDuration'] for r in picked], dtype=float)
+    win = np.array([bool(m['win']) for m in mine])
+    kills = np.array([m['kills'] for m in mine])
+    deaths = np.array([m['deaths'] for m in mine])
+    assists = np.array([m['assists'] for m in mine])
+    cs = np.array([m['totalMinionsKilled'] + m['neutralMinionsKilled'] for m in mine], dtype=float)
+    gold = np.array([m['goldEarned'] for m in mine], dtype=float)
+    dmg = np.array([m['totalDamageDealtToChampions'] for m in mine], dtype=float)
+    items = np.array([sum(1 for i in range(6) if m.get(f'item{i}', 0) != 0) for m in mine])
+
+    duration_min = duration / 60
+    share = np.divide(dmg * 100, team_dmg, out=np.zeros_like(dmg), where=team_dmg > 0)
+    columns = {
+        "wins": win.astype(int),
+        "kills": kills,
+        "deaths": deaths,
+        "assists": assists,
+        "cspm": cs / duration_min,
+        "gpm": gold / duration_min,
+        "dmg_share": share,
+        "troll_deaths": (deaths >= 12).astype(int),
+        "troll_items": ((items <= 1) & (duration_min > 10)).astype(int),
+        "troll_dmg": ((team_dmg > 0) & (share < 5.0)).astype(int),
+        "troll_ff": (~win & (duration < 1200)).astype(int),
+    }
+    columns = {k: v.tolist() for k, v in columns.items()}
+
+    entries = []
+    for j, r in enumerate(picked):
+        entry = {"id": records[r][0], "t": records[r][1].get('gameCreation', 0), "valid": 1}
+        for k, v in columns.items(): entry[k] = v[j]
+        entries.append(entry)
+    return entries
+
+
+def troll_labels(sums):
+    valid, wins = sums["valid"], sums["wins"]
+    trolls = []
+    if sums["troll_deaths"] >= valid * 0.3: trolls.append(f"💀OverDeath({sums['troll_deaths']})")
+    if sums["troll_items"] >= 1: trolls.append(f"💀NoItem")
+    if sums["troll_dmg"] >= 2: trolls.append(f"💀LowDmg")
+    if (valid - wins) > 0 and (sums["troll_ff"] / (valid - wins)) >= 0.5: trolls.append(f"💀EarlyFF")
+    return trolls
+
+
+def summarize(sums):
+    # 合計値から平均指標を出す (有効試合なしなら None)
+    valid = sums["valid"]
+    if valid == 0: return None
+    return {
+        "win_rate": (sums["wins"] / valid) * 100,
+        "kda": (sums["kills"] + sums["assists"]) / (sums["deaths"] if sums["deaths"] > 0 else 1),
+        "cspm": sums["cspm"] / valid,
+        "gpm": sums["gpm"] / valid,
+        "dmg": sums["dmg_share"] / valid,
+        "matches": valid,
+        "trolls": troll_labels(sums),
+    }
+
+
+def summarize_batch(sums_list):
+    # 名簿全体の sums をまとめて指標に変換する (再採点用)
+    if np is None or not sums_list:
+        return [summarize(s) for s in sums_list]
+
+    m = np.array([[s.get(k, 0) for k in SUM_KEYS] for s in sums_list], dtype=float)
+    col = {k: m[:, i] for i, k in enumerate(SUM_KEYS)}
+    valid = col["valid"]
+    safe_valid = np.where(valid > 0, valid, 1)
+    win_rate = col["wins"] / safe_valid * 100
+    kda = (col["kills"] + col["assists"]) / np.where(col["deaths"] > 0, col["deaths"], 1)
+    cspm = col["cspm"] / safe_valid
+    gpm = col["gpm"] / safe_valid
+    dmg = col["dmg_share"] / safe_valid
+
+    results = []
+    for i, s in enumerate(sums_list):
+        if valid[i] == 0:
+            results.append(None)
+            continue
+        results.append({"win_rate": float(win_rate[i]), "kda": float(kda[i]), "cspm": float(cspm[i]),
+                        "gpm": float(gpm[i]), "dmg": float(dmg[i]), "matches": int(valid[i]),
+                        "trolls": troll_labels(s)})
+    return results
@@ -0,0 +1,71 @@
+import datetime
+from db_repository import run_db
+
+# ==========================================
+# 成績の履歴 (追記のみ) と直近 7日 / 30日の集計
+# ==========================================
+# 分析のたびの成績をプレイヤー × 日ごとのバケット文書に追記する (_id = "puuid:YYYYMMDD")。
+# 同じプレイヤーが複数サーバーに登録していても履歴は1つ。
+# 追記した時に直近 TREND_WINDOWS 日ぶんのバケット (最大30件) から平均と変化量を計算し、
+# users 側の trend フィールドに保存しておく。ランキングは trend を並べ替えるだけで済む。
+STATS_HISTORY_COLLECTION = "stats_history"
+HISTORY_METRICS = ("win_rate", "kda", "gpm")
+TREND_WINDOWS = {"7d": 7, "30d": 30}
+
+
+def bucket_id(puuid, day):
+    return f"{puuid}:{day:%Y%m%d}"
+
+
+def compute_trend(buckets, today):
+    # buckets: 日付昇順のバケット。窓ごとに {指標: {"avg": 平均, "delta": 最新 - 窓内最古}} と件数を返す
+    trend = {}
+    for label, days in TREND_WINDOWS.items():
+        start = today - datetime.timedelta(days=days - 1)
+        in_window = [b for b in buckets if b["day"].date() >= start]
+        n = sum(b["n"] for b in in_window)
+        if not n: continue
+        first, last = in_window[0]["first"], in_window[-1]["last"]
+        entry = {"n": n}
+        for m in HISTORY_METRICS:
+            entry[m] = {"avg": sum(b["sums"][m] for b in in_window) / n, "delta": last[m] - first[m]}
+        trend[label] = entry
+    return trend
+
+
+class StatsHistory:
+    def __init__(self, collection=None):
+        self.collection = collection
+
+    async def record(self, puuid, stats, now=None):
+        # 今回の成績を追記し、更新後の trend を返す (DB なしなら None)
+        if self.collection is None: return None
+        now = now or datetime.datetime.now()
+        today = now.date()
+        sample = {"t": now, **{m: stats[m] for m in HISTORY_METRICS}}
+        try:
+            await run_db(self.collection.update_one, {"_id": bucket_id(puuid, today)}, {
+                "$setOnInsert": {"puuid": puuid, "day": datetime.datetime(today.year, today.month, today.day),
+                                 "first": sample},
+                "$push": {"samples": sample},
+                "$inc": {"n": 1, **{f"sums.{m}": sample[m] for m in HISTORY_METRICS}},
+                "$set": {"last": sample},
+            }, upsert=True, db_op="stats_history.record")
+        except Exception as e:
+            print(f"⚠️ 成績履歴の保存スキップ: {e}")
+            return None
+        return await self.trend(puuid, now)
+
+    async def trend(self, puuid, now=None):
+        # 保存済みの履歴から trend だけ計算する (追記はしない)
+        if self.collection is None: return None
+        today = (now or datetime.datetime.now()).date()
+        start = today - datetime.timedelta(days=max(TREND_WINDOWS.values()) - 1)
+        query = {"_id": {"$gte": bucket_id(puuid, start), "$lte": bucket_id(puuid, today)}}
+        try:
+            buckets = await run_db(lambda: [*self.collection.find(query, {"samples": 0}).sort("_id", 1)],
+                                   db_op="stats_history.find")
+        except Exception as e:
+            print(f"⚠️ 成績履歴の読込スキップ: {e}")
+            return None
+        return compute_trend(buckets, today)
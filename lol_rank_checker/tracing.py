@@ -0,0 +1,164 @@
+import cProfile
+import datetime
+import io
+import pstats
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# ==========================================
+# 処理区間の計測 (トレース) と cProfile の取得
+# ==========================================
+# コマンドや監査を1本のトレースとし、その中の区間 (Riot API・DB・DM など) の所要時間を記録する。
+# トレースは ContextVar で持つので、asyncio.gather で並行に走る区間も同じトレースに入る。
+# 記録はメモリ上の固定長バッファだけ (古いものから消える)。/perf で確認する。
+TRACE_BUFFER_SIZE = 200
+PHASE_SAMPLES = 500
+# 1本のトレースに残す区間数の上限 (大人数の監査でもメモリが増え続けないように)
+MAX_SPANS_PER_TRACE = 300
+PROFILE_BUFFER_SIZE = 5
+PROFILE_TOP = 25
+
+current_trace = ContextVar("current_trace", default=None)
+traces = deque(maxlen=TRACE_BUFFER_SIZE)
+# 区間名 -> 直近の所要時間 (秒)
+phase_samples = {}
+profiles = deque(maxlen=PROFILE_BUFFER_SIZE)
+
+
+class Trace:
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.started_at = datetime.datetime.now()
+        self.start = time.perf_counter()
+        self.total = None
+        self.status = "ok"
+        # [(区間名, 開始からの秒数, 所要秒数), ...]
+        self.spans = []
+        self.dropped = 0
+        self.profile = None
+
+    def add(self, name, offset, duration):
+        if len(self.spans) < MAX_SPANS_PER_TRACE:
+            self.spans.append((name, offset, duration))
+        else:
+            self.dropped += 1
+
+    def breakdown(self):
+        # 区間名ごとに (回数, 合計, 最大) をまとめ、合計の大きい順に返す
+        summary = {}
+        for name, _, duration in self.spans:
+            n, total, worst = summary.get(name, (0, 0.0, 0.0))
+            summary[name] = (n + 1, total + duration, max(worst, duration))
+        return sorted(summary.items(), key=lambda x: -x[1][1])
+
+
+def record_phase(name, duration):
+    samples = phase_samples.get(name)
+    if samples is None: samples = phase_samples[name] = deque(maxlen=PHASE_SAMPLES)
+    samples.append(duration)
+
+
+@contextmanager
+def span(name):
+    # トレースの外で呼ばれても区間ごとの統計には入る
+    trace = current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        record_phase(name, duration)
+        if trace is not None: trace.add(name, start - trace.start, duration)
+
+
+async def traced(name, awaitable):
+    # asyncio.gather に渡すコルーチンを1件ずつ計測する
+    with span(name):
+        return await awaitable
+
+
+def start_trace(name, **attrs):
+    # (トレース, 戻すためのトークン) を返す。コマンドの前後フックのように with で囲めない所で使う
+    trace = Trace(name, **attrs)
+    return trace, current_trace.set(trace)
+
+
+def finish_trace(trace, token, status="ok"):
+    trace.total = time.perf_counter() - trace.start
+    trace.status = status
+    current_trace.reset(token)
+    record_phase(trace.name, trace.total)
+    traces.append(trace)
+
+
+@contextmanager
+def trace(name, **attrs):
+    # 既にトレース中ならその中の区間として記録する (コマンドから呼ばれた監査など)
+    if current_trace.get() is not None:
+        with span(name):
+            yield
+        return
+    t, token = start_trace(name, **attrs)
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        finish_trace(t, token, status)
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def phase_stats():
+    # [(区間名, 回数, p50, p95, 最大), ...] を p95 の大きい順に返す
+    rows = []
+    for name, samples in phase_samples.items():
+        values = sorted(samples)
+        if values: rows.append((name, len(values), percentile(values, 0.5), percentile(values, 0.95), values[-1]))
+    return sorted(rows, key=lambda r: -r[3])
+
+
+def slowest(n=5):
+    return sorted((t for t in traces if t.total is not None), key=lambda t: -t.total)[:n]
+
+
+# ---------- cProfile (次の N 件のコマンドだけ) ----------
+class ProfileSampler:
+    # cProfile は同時に1つしか動かせず、動いている間はイベントループ上の他の処理も一緒に記録される。
+    # そのため取得中に来たコマンドは飛ばし (間引き)、取得済みの件数が N に達したら止める
+    def __init__(self):
+        self.remaining = 0
+        self.active = None
+        self.skipped = 0
+
+    def arm(self, n):
+        self.remaining = max(0, n)
+        self.skipped = 0
+
+    def maybe_start(self, trace):
+        if self.remaining <= 0 or self.active is not None:
+            if self.remaining > 0: self.skipped += 1
+            return
+        self.remaining -= 1
+        self.active = trace
+        trace.profile = cProfile.Profile()
+        trace.profile.enable()
+
+    def stop(self, trace):
+        if self.active is not trace: return
+        trace.profile.disable()
+        self.active = None
+        buf = io.StringIO()
+        pstats.Stats(trace.profile, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        trace.profile = None
+        profiles.append((trace.started_at, trace.name, time.perf_counter() - trace.start, buf.getvalue()))
+
+
+profiler = ProfileSampler()
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import socket
+import traceback
+import bot
+from guild_config import GuildConfig
+from job_queue import LEASE_SECONDS
+
+# ==========================================
+# 分析ワーカー (Bot 本体とは別プロセス)
+# ==========================================
+# 使い方 (lol_rank_checker/ で実行、Bot 本体と同じ MONGO_URL / RIOT_API_KEY を設定する):
+#   python worker.py
+# 何台起動してもよい。Bot 本体を JOB_QUEUE=1 で起動すると /link・/import と監査がジョブとしてここに回ってくる。
+# Riot API のレート制限は全プロセス共通なので、各ワーカーはレスポンスヘッダーの使用回数に合わせて待つ。
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 4))
+IDLE_POLL_INTERVAL = 1.0
+
+
+def link_result(result):
+    # Discord への返信に使う部分だけ返す (分析結果には DB に保存できない値も含まれる)
+    data = result.get("data") or {}
+    return {"status": result["status"], "reason": result.get("reason"),
+            "data": {k: v for k, v in data.items() if isinstance(v, (str, int, float, bool))}}
+
+
+async def handle_link(payload):
+    # 基準はジョブを積んだ時点のもの (監査ジョブの max_level と同じ)
+    cfg = GuildConfig(payload["guild_id"], {payload["mode"]: payload["thresholds"]}, payload["mode"],
+                      payload["max_level"])
+    result = await bot.analyze_player_shared(payload["name"], payload["tag"], None, payload["is_exempt"], cfg)
+    # 新規登録かどうかも返し、Bot 本体が人数のキャッシュを合わせられるようにする
+    upserted = False
+    if payload["discord_id"] and result.get("profile"):
+        upserted = await bot.save_user_to_db(cfg.guild_id, payload["discord_id"], **result["profile"])
+    return {**link_result(result), "upserted": upserted}
+
+
+async def handle_audit(payload):
+    ops, graduates = await bot.check_levels(payload["users"], payload["max_level"])
+    if ops: await bot.users_repo.bulk_write(ops)
+    return {"graduates": [{"_id": u["_id"], "level": level} for u, level in graduates]}
+
+
+async def handle_import(payload):
+    # 一括登録の1人分。/link と同じ処理をバックグラウンド扱いで行う
+    with bot.priority(bot.PRIORITY_BACKGROUND):
+        return await handle_link(payload)
+
+
+HANDLERS = {"link": handle_link, "import": handle_import, "audit": handle_audit}
+
+
+async def keep_lease(job, worker_id):
+    # 処理中はリースを延長し続ける (他のワーカーに取られたらやめる)
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        try:
+            if not await bot.job_queue.extend(job["_id"], worker_id): return
+        except Exception as e:
+            print(f"⚠️ リース延長失敗: {e}")
+
+
+async def run_job(job, worker_id, slots):
+    lease = asyncio.create_task(keep_lease(job, worker_id))
+    try:
+        handler = HANDLERS.get(job["kind"])
+        if handler is None: raise ValueError(f"unknown job kind: {job['kind']}")
+        result = await handler(job["payload"])
+        await bot.job_queue.complete(job["_id"], worker_id, result)
+        print(f"✅ ジョブ完了: {job['kind']} {job['_id']}")
+    except Exception as e:
+        traceback.print_exc()
+        try:
+            await bot.job_queue.fail(job, worker_id, str(e))
+        except Exception as e2:
+            print(f"⚠️ ジョブの失敗記録に失敗 (期限切れ後に再試行されます): {e2}")
+    finally:
+        lease.cancel()
+        slots.release()
+
+
+async def main():
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    if not bot.MONGO_URL:
+        print("❌ MONGO_URL が未設定です")
+        return
+    # DB 接続と切断時の再接続は Bot 本体と同じ仕組みを使う
+    keeper = asyncio.create_task(bot.mongo_keeper())
+    slots = asyncio.Semaphore(WORKER_CONCURRENCY)
+    running = set()
+    print(f"🛠️ ワーカー起動: {worker_id} (同時 {WORKER_CONCURRENCY} 件)")
+    try:
+        while True:
+            await slots.acquire()
+            job = None
+            if bot.job_queue.available:
+                try:
+                    job = await bot.job_queue.claim(worker_id)
+                    if job is None: await bot.job_queue.expire_abandoned()
+                except Exception as e:
+                    print(f"⚠️ ジョブ取得失敗: {e}")
+            if job is None:
+                slots.release()
+                await asyncio.sleep(IDLE_POLL_INTERVAL)
+                continue
+            task = asyncio.create_task(run_job(job, worker_id, slots))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        keeper.cancel()
+        await bot.riot_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())